@@ -16,28 +16,747 @@ import sys
 import os
 import stat
 import difflib
+import hashlib
+import heapq
+import Queue
+import shutil
+import subprocess
+import tempfile
+import threading
 import time
 import csv
+import cgi
+import json
 import string
 import datetime
+from satprep_shared import is_compact_snapshot, read_compact_snapshot
 
 #define logger
 LOGGER = logging.getLogger('satprep_diff')
 
 #TODO: delete original snapshots after creating delta option
-#TODO: use pre-existing delta CSV instead of creating one (e.g. for testing purposes)
 
 
 
 class LaTeXTemplate(string.Template):
 	delimiter = "%%"
 
+
+
+class CompiledTemplate(object):
+	#template that is parsed once and rendered by joining its literal parts and values
+	def __init__(self, data, templateClass=LaTeXTemplate):
+		self.literals = []
+		self.names = []
+		literal = []
+		position = 0
+		for match in templateClass.pattern.finditer(data):
+			literal.append(data[position:match.start()])
+			position = match.end()
+			if match.group("escaped") is not None:
+				literal.append(templateClass.delimiter)
+			elif match.group("named") is not None or match.group("braced") is not None:
+				self.literals.append("".join(literal))
+				self.names.append(match.group("named") or match.group("braced"))
+				literal = []
+			else:
+				lines = data[:match.start("invalid")].splitlines(True)
+				raise ValueError("Invalid placeholder in string: line %d, col %d" % (len(lines) or 1, len(lines[-1]) if lines else 1))
+		literal.append(data[position:])
+		self.literals.append("".join(literal))
+	
+	def substitute(self, **values):
+		#raises KeyError for missing values like string.Template
+		parts = [self.literals[0]]
+		for i in range(len(self.names)):
+			parts.append("%s" % (values[self.names[i]],))
+			parts.append(self.literals[i+1])
+		return "".join(parts)
+
+
+
+#human-readable names of errata columns
+ERRATA_COLUMN_NAMES = {"errata_name": "Name", "errata_date": "Date", "errata_desc": "Description", "errata_reboot": "Reboot required", "errata_type": "Type"}
+
+
+
+class ErrataTable(object):
+	#renders the errata table of a host report row by row, other formats override the row methods
+	def __init__(self, columns):
+		self.columns = columns
+	
+	def escape(self, value):
+		return value
+	
+	def header(self):
+		return ""
+	
+	def row(self, errata):
+		return ""
+	
+	def footer(self):
+		return ""
+	
+	def render(self, errata):
+		parts = [self.header()]
+		for e in errata:
+			parts.append(self.row(e))
+		parts.append(self.footer())
+		return "".join(parts)
+
+
+
+class LaTeXErrataTable(ErrataTable):
+	#errata table as LaTeX tabularx environment
+	def escape(self, value):
+		return value.replace("_", "\\_")
+	
+	def header(self):
+		descriptor = []
+		for column in self.columns:
+			if column == "errata_desc" or column == "errata_name": descriptor.append(" | X")
+			else: descriptor.append(" | l")
+		descriptor.append(" | ")
+		names = ["\\textbf{" + ERRATA_COLUMN_NAMES.get(column, column) + "} " for column in self.columns]
+		return "\n".join(["\\section*{}", "\\begin{tabularx}{\\textwidth}{" + "".join(descriptor) + "}", "\\hline", "\\multicolumn{" + str(len(self.columns)) + "}{|c|}{\\cellcolor{Gray}\\textbf{List of installed patches}} \\\\", "\\hline", "& ".join(names) + "\\\\", ""])
+	
+	def row(self, errata):
+		return " & ".join([self.escape(errata[column]) + " " for column in self.columns]) + "\\\\\n"
+	
+	def footer(self):
+		return "\n\\hline\n\\end{tabularx}"
+
+
+
+def get_errata(line, repcols):
+	#get human-readable errata information of a report line
+	errata = {}
+	for column in ERRATA_COLUMN_NAMES:
+		if repcols[column] >= 666:
+			errata[column] = "unknown"
+		elif column == "errata_reboot":
+			if line[repcols[column]] == "1": errata[column] = "yes"
+			else: errata[column] = "no"
+		else:
+			errata[column] = line[repcols[column]]
+	return errata
+
+
+
+def get_host_info(host, rows, repcols, vlog, date):
+	#get host information from the delta lines of a host, the last line wins
+	info = {"hostname": host, "date": date, "ip": "", "owner": "", "errata": [], "reboot": False, "monitoringDowntime": False, "monitoringNotes": ""}
+	for line in rows:
+		if options.debug: LOGGER.debug("Found relevant line for " + host + ": " + str(line))
+		#define IP address if present in report
+		if repcols["ip"] < 666: info["ip"] = line[repcols["ip"]]
+		
+		#set owner if present in report
+		if repcols["system_owner"] < 666: info["owner"] = line[repcols["system_owner"]].replace("%%nl", "\n")
+		
+		#set system cluster bit if specified and present in report
+		info["cluster"] = repcols["system_cluster"] < 666 and line[repcols["system_cluster"]] == "1"
+		if info["cluster"]: info["clusterNotes"] = ""
+		else: info["clusterNotes"] = "not a cluster system"
+		
+		#set system monitoring bit if specified and present in report
+		if repcols["system_monitoring"] < 666 and line[repcols["system_monitoring"]] == "0":
+			#no monitoring
+			info["monitoringDowntime"] = False
+		else:
+			#set box/comment if downtime scheduled
+			if repcols["system_monitoring_name"] < 666 and line[repcols["system_monitoring_name"]] != "":
+				tempHost = line[repcols["system_monitoring_name"]]
+				if "@" in tempHost: tempHost = tempHost[:tempHost.find("@")]
+			else: tempHost = host
+			info["monitoringDowntime"] = "MONOK;"+tempHost in vlog
+			if info["monitoringDowntime"]: LOGGER.debug("MONOK;"+tempHost+" in vlog!")
+			else: LOGGER.debug("MONOK;"+tempHost+" NOT in vlog!")
+		if repcols["system_monitoring_notes"] < 666 and len(line[repcols["system_monitoring_notes"]]) > 1:
+			info["monitoringNotes"] = line[repcols["system_monitoring_notes"]]
+		else: info["monitoringNotes"] = ""
+		
+		#set system backup and antivirus bits if specified and present in report, add notes if not available
+		for (name, column) in [("backup", "system_backup"), ("antivir", "system_antivir")]:
+			info[name] = not (repcols[column] < 666 and line[repcols[column]] == "0")
+			if not info[name] and repcols[column+"_notes"] < 666 and len(line[repcols[column+"_notes"]]) > 1:
+				info[name+"Notes"] = line[repcols[column+"_notes"]]
+			else:
+				info[name+"Notes"] = ""
+		
+		#set system virtualization bit if specified and present in report
+		info["virtual"] = repcols["system_virt"] < 666 and line[repcols["system_virt"]] == "1"
+		if info["virtual"]:
+			info["hwCheckNotes"] = "not a physical host"
+			info["vmSnapshotNotes"] = ""
+			#set box/comment if snapshot created
+			if repcols["system_virt_vmname"] < 666 and line[repcols["system_virt_vmname"]] != "":
+				tempHost = line[repcols["system_virt_vmname"]]
+				if "@" in tempHost: tempHost = tempHost[:tempHost.find("@")]
+			else: tempHost = host
+			info["vmSnapshot"] = "SNAPOK;"+tempHost in vlog
+			if info["vmSnapshot"]: LOGGER.debug("SNAPOK;"+tempHost + " in vlog!")
+			else: LOGGER.debug("SNAPOK;"+tempHost + " NOT in vlog!")
+		else:
+			info["hwCheckNotes"] = ""
+			info["vmSnapshot"] = False
+			info["vmSnapshotNotes"] = "not a virtual machine"
+		
+		#set errata information
+		if repcols["errata_reboot"] < 666 and line[repcols["errata_reboot"]] == "1":
+			info["reboot"] = True
+		if repcols["errata_name"] < 666 and line[repcols["errata_name"]] != "":
+			info["errata"].append(get_errata(line, repcols))
+	
+	#set reboot notes
+	if info["reboot"]: info["rebootNotes"] = ""
+	else: info["rebootNotes"] = "no reboot required"
+	return info
+
+
+
+def get_checklist(info):
+	#get procedure checklist items (task, success, notes) that are known from the host information
+	checklist = []
+	if info["virtual"]: checklist.append(("Hardware check", "no", info["hwCheckNotes"]))
+	if info["vmSnapshot"]: checklist.append(("Snapshot of virtual machine created", "yes", info["vmSnapshotNotes"]))
+	else: checklist.append(("Snapshot of virtual machine created", "no", info["vmSnapshotNotes"]))
+	if info["monitoringDowntime"]: checklist.append(("Monitoring disabled", "yes", info["monitoringNotes"]))
+	else: checklist.append(("Monitoring disabled", "no", info["monitoringNotes"]))
+	if not info["reboot"]: checklist.append(("System rebooted", "no", info["rebootNotes"]))
+	if not info["backup"]: checklist.append(("Backup services up and running", "no", info["backupNotes"]))
+	if not info["antivir"]: checklist.append(("Anti-virus services up and running", "no", info["antivirNotes"]))
+	if not info["cluster"]: checklist.append(("Cluster test", "no", info["clusterNotes"]))
+	return checklist
+
+
+
+class HostReport(object):
+	#renders reports of one or multiple hosts from host information
+	extension = ""
+	
+	def __init__(self, columns):
+		self.columns = columns
+	
+	def render(self, info):
+		raise NotImplementedError
+	
+	def render_all(self, infos):
+		return "".join([self.render(info) for info in infos])
+
+
+
+class LaTeXReport(HostReport):
+	#LaTeX report based on a template, rendered to PDF by pdflatex
+	extension = ".tex"
+	
+	def __init__(self, columns, template):
+		HostReport.__init__(self, columns)
+		self.template = template
+		self.errataTable = LaTeXErrataTable(columns)
+	
+	def box(self, checked):
+		if checked: return "$\\CheckedBox$"
+		return "$\\Box$"
+	
+	def render(self, info):
+		#Substitute template variables
+		return self.template.substitute(titleHostname=info["hostname"], ip=info["ip"], date=info["date"], owner=info["owner"].replace("\n", "\\newline "), systemStandalone=self.box(not info["cluster"]), systemCluster=self.box(info["cluster"]), hintsClusterTest=info["clusterNotes"], hwCheckNo=self.box(info["virtual"]), hwCheckNotes=info["hwCheckNotes"], vmSnapYes=self.box(info["vmSnapshot"]), vmSnapNo=self.box(not info["vmSnapshot"]), vmSnapNotes=info["vmSnapshotNotes"], rebootNo=self.box(not info["reboot"]), rebootNotes=info["rebootNotes"], errata=self.errataTable.render(info["errata"]), orientation=options.pageOrientation+",", footer=options.footer, logo=options.logoImage, monSchedYes=self.box(info["monitoringDowntime"]), monSchedNo=self.box(not info["monitoringDowntime"]), monSchedNotes=info["monitoringNotes"], BackupNo=self.box(not info["backup"]), BackupNoNotes=info["backupNotes"], AntivirNo=self.box(not info["antivir"]), AntivirNoNotes=info["antivirNotes"])
+	
+	def render_all(self, infos):
+		return combine_reports([self.render(info) for info in infos])
+
+
+
+class HTMLErrataTable(ErrataTable):
+	#errata table as HTML table
+	def escape(self, value):
+		return cgi.escape(value, True)
+	
+	def header(self):
+		return "<table>\n<tr><th colspan=\"" + str(len(self.columns)) + "\">List of installed patches</th></tr>\n<tr>" + "".join(["<th>" + ERRATA_COLUMN_NAMES.get(column, column) + "</th>" for column in self.columns]) + "</tr>\n"
+	
+	def row(self, errata):
+		return "<tr>" + "".join(["<td>" + self.escape(errata[column]) + "</td>" for column in self.columns]) + "</tr>\n"
+	
+	def footer(self):
+		return "</table>\n"
+
+
+
+class HTMLReport(HostReport):
+	#self-contained HTML report without external resources
+	extension = ".html"
+	style = "body { font-family: sans-serif; margin: 2em; } table { border-collapse: collapse; width: 100%; margin-bottom: 1.5em; } th, td { border: 1px solid #999; padding: 0.2em 0.5em; text-align: left; vertical-align: top; } th { background-color: #e6e6e6; }"
+	
+	def __init__(self, columns):
+		HostReport.__init__(self, columns)
+		self.errataTable = HTMLErrataTable(columns)
+	
+	def document(self, title, body):
+		return "".join(["<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>", cgi.escape(title), "</title>\n<style>", self.style, "</style>\n</head>\n<body>\n", body, "</body>\n</html>\n"])
+	
+	def section(self, info, level):
+		escape = self.errataTable.escape
+		parts = ["<h" + str(level) + " id=\"" + escape(info["hostname"]) + "\">System maintenance report for " + escape(info["hostname"]) + "</h" + str(level) + ">\n"]
+		parts.append("<table>\n<tr><th>IP</th><td>" + escape(info["ip"]) + "</td><th>Date</th><td>" + escape(info["date"]) + "</td><th>Responsible</th><td>" + escape(info["owner"]).replace("\n", "<br>") + "</td></tr>\n</table>\n")
+		parts.append("<table>\n<tr><th>Task</th><th>Success</th><th>Error description/notes</th></tr>\n")
+		for (task, success, notes) in get_checklist(info):
+			parts.append("<tr><td>" + task + "</td><td>" + success + "</td><td>" + escape(notes) + "</td></tr>\n")
+		parts.append("</table>\n")
+		parts.append(self.errataTable.render(info["errata"]))
+		return "".join(parts)
+	
+	def render(self, info):
+		return self.document("System maintenance report for " + info["hostname"], self.section(info, 1))
+	
+	def render_all(self, infos):
+		escape = self.errataTable.escape
+		parts = ["<h1>System maintenance report</h1>\n<table>\n<tr><th>Host</th><th>IP</th><th>Errata</th><th>Reboot required</th></tr>\n"]
+		for info in infos:
+			parts.append("<tr><td><a href=\"#" + escape(info["hostname"]) + "\">" + escape(info["hostname"]) + "</a></td><td>" + escape(info["ip"]) + "</td><td>" + str(len(info["errata"])) + "</td><td>" + ["no", "yes"][info["reboot"]] + "</td></tr>\n")
+		parts.append("</table>\n")
+		for info in infos:
+			parts.append(self.section(info, 2))
+		return self.document("System maintenance report", "".join(parts))
+
+
+
+class MarkdownErrataTable(ErrataTable):
+	#errata table as Markdown pipe table
+	def escape(self, value):
+		return value.replace("|", "\\|").replace("\n", " ")
+	
+	def header(self):
+		return "| " + " | ".join([ERRATA_COLUMN_NAMES.get(column, column) for column in self.columns]) + " |\n" + "|---" * len(self.columns) + "|\n"
+	
+	def row(self, errata):
+		return "| " + " | ".join([self.escape(errata[column]) for column in self.columns]) + " |\n"
+
+
+
+class MarkdownReport(HostReport):
+	#Markdown report using pipe tables
+	extension = ".md"
+	
+	def __init__(self, columns):
+		HostReport.__init__(self, columns)
+		self.errataTable = MarkdownErrataTable(columns)
+	
+	def section(self, info, level):
+		escape = self.errataTable.escape
+		parts = ["#" * level + " System maintenance report for " + info["hostname"] + "\n\n"]
+		parts.append("| IP | Date | Responsible |\n|---|---|---|\n| " + escape(info["ip"]) + " | " + escape(info["date"]) + " | " + escape(info["owner"]) + " |\n\n")
+		parts.append("#" * (level+1) + " Procedure checklist\n\n| Task | Success | Error description/notes |\n|---|---|---|\n")
+		for (task, success, notes) in get_checklist(info):
+			parts.append("| " + task + " | " + success + " | " + escape(notes) + " |\n")
+		parts.append("\n" + "#" * (level+1) + " List of installed patches\n\n")
+		parts.append(self.errataTable.render(info["errata"]))
+		return "".join(parts)
+	
+	def render(self, info):
+		return self.section(info, 1)
+	
+	def render_all(self, infos):
+		escape = self.errataTable.escape
+		parts = ["# System maintenance report\n\n| Host | IP | Errata | Reboot required |\n|---|---|---|---|\n"]
+		for info in infos:
+			parts.append("| " + escape(info["hostname"]) + " | " + escape(info["ip"]) + " | " + str(len(info["errata"])) + " | " + ["no", "yes"][info["reboot"]] + " |\n")
+		for info in infos:
+			parts.append("\n" + self.section(info, 2))
+		return "".join(parts)
+
+
+
+class JSONReport(HostReport):
+	#host information as JSON document
+	extension = ".json"
+	
+	def render(self, info):
+		return json.dumps(info, indent=2, sort_keys=True) + "\n"
+	
+	def render_all(self, infos):
+		return json.dumps({"hosts": infos}, indent=2, sort_keys=True) + "\n"
+
+
+
+#report formats besides LaTeX
+REPORT_FORMATS = {"html": HTMLReport, "markdown": MarkdownReport, "json": JSONReport}
+
+
+
+def iter_report(filename):
+	#read snapshot report lines one by one, compact reports are converted to CSV lines
+	if is_compact_snapshot(filename):
+		with open(filename, 'rb') as report:
+			for row in read_compact_snapshot(report):
+				yield ";".join(row) + "\r\n"
+	else:
+		with open(filename, 'r') as report:
+			for line in report:
+				yield line
+
+
+
+def read_report(filename):
+	#read all snapshot report lines
+	return list(iter_report(filename))
+
+
+
+def sort_report(filename, bufferSize):
+	#sort report lines, chunks exceeding the buffer are sorted into temporary files and merged
+	runs = []
+	chunk = []
+	try:
+		for line in iter_report(filename):
+			#runs are read back line by line, so lines are compared including their line break
+			if not line.endswith("\n"): line = line + "\n"
+			chunk.append(line)
+			if len(chunk) >= bufferSize:
+				runs.append(write_sorted_run(chunk))
+				chunk = []
+		if len(runs) == 0:
+			for line in sorted(chunk):
+				yield line
+			return
+		runs.append(write_sorted_run(chunk))
+		LOGGER.debug("Merging {0} sorted runs of report {1}".format(len(runs), filename))
+		for line in heapq.merge(*runs):
+			yield line
+	finally:
+		#temporary files are removed when closed
+		for run in runs:
+			run.close()
+
+
+
+def write_sorted_run(lines):
+	run = tempfile.TemporaryFile()
+	lines.sort()
+	for line in lines:
+		run.write(line)
+	run.seek(0)
+	return run
+
+
+
+def get_removed_lines_sorted(lines1, lines2):
+	#get lines of the first report missing in the second one, both reports need to be sorted
+	lines2 = iter(lines2)
+	other = next(lines2, None)
+	for line in lines1:
+		while other is not None and other < line:
+			other = next(lines2, None)
+		if other == line:
+			other = next(lines2, None)
+		else:
+			yield line
+
+
+
+def get_removed_lines(lines1, lines2):
+	#get lines of the first report missing in the second one, hashing keeps this linear
+	remaining = {}
+	for line in lines2:
+		remaining[line] = remaining.get(line, 0) + 1
+	removed = []
+	for line in sorted(lines1):
+		if remaining.get(line, 0) > 0:
+			remaining[line] = remaining[line] - 1
+		else:
+			removed.append(line)
+	return removed
+
+
+
+def get_removed_lines_ndiff(lines1, lines2):
+	#previous approach using difflib.ndiff, only used for benchmarks
+	diff = difflib.ndiff(sorted(lines1), sorted(lines2))
+	return [x[2:] for x in diff if x.startswith('- ')]
+
+
+
+def benchmark_delta(filename1, filename2, bufferSize):
+	#compare all approaches using the given reports
+	lines1 = read_report(filename1)
+	lines2 = read_report(filename2)
+	start = time.time()
+	removed = get_removed_lines(lines1, lines2)
+	LOGGER.info("Delta engine found {0} removed lines in {1:.3f} seconds".format(len(removed), time.time()-start))
+	start = time.time()
+	removedSorted = list(get_removed_lines_sorted(sort_report(filename1, bufferSize), sort_report(filename2, bufferSize)))
+	LOGGER.info("Low-memory delta engine found {0} removed lines in {1:.3f} seconds (including reading reports)".format(len(removedSorted), time.time()-start))
+	start = time.time()
+	removedNdiff = get_removed_lines_ndiff(lines1, lines2)
+	LOGGER.info("difflib.ndiff found {0} removed lines in {1:.3f} seconds".format(len(removedNdiff), time.time()-start))
+	if removed != removedNdiff or removedSorted != removedNdiff:
+		LOGGER.error("Delta engine and difflib.ndiff results differ!")
+		return False
+	return True
+
+
+
+def get_render_cache_salt():
+	#rendered reports also depend on the logo and the pdflatex binary
+	salt = hashlib.sha1()
+	for filename in [options.logoImage, os.path.realpath(options.pathPdflatex)]:
+		salt.update(filename + "\0")
+		if os.path.isfile(filename):
+			with open(filename, "rb") as f:
+				for block in iter(lambda: f.read(65536), ""):
+					salt.update(block)
+	return salt.hexdigest()
+
+
+
+def get_render_cache_file(texFile, salt):
+	#cached PDF reports are named after the hash of their content
+	with open(texFile, "rb") as f:
+		key = hashlib.sha1(salt + f.read()).hexdigest()
+	return os.path.join(options.renderCache, key + ".pdf")
+
+
+
+def split_preamble(report):
+	#split report into document class/packages, other preamble lines and the document
+	(preamble, document) = report.split("\\begin{document}", 1)
+	static = []
+	dynamic = []
+	for line in preamble.splitlines(True):
+		if line.startswith("\\documentclass") or line.startswith("\\usepackage"):
+			static.append(line)
+		else:
+			dynamic.append(line)
+	return ("".join(static), "".join(dynamic), "\\begin{document}" + document)
+
+
+
+def create_format(texFile):
+	#dump document class and packages into a format file once, returns (format, preamble)
+	with open(texFile, "r") as f:
+		(static, dynamic, document) = split_preamble(f.read())
+	pdflatex = os.path.realpath(options.pathPdflatex)
+	key = hashlib.sha1(static + pdflatex + str(os.path.getmtime(pdflatex))).hexdigest()
+	name = "satprep-" + os.path.basename(options.template) + "-" + key[:12]
+	if os.path.exists(name + ".fmt"):
+		LOGGER.debug("Re-using precompiled preamble " + name + ".fmt")
+		return (os.path.abspath(name), static)
+
+	workDir = tempfile.mkdtemp(prefix="satprep-")
+	try:
+		with open(os.path.join(workDir, name + ".tex"), "w") as f:
+			f.write(static + "\\dump\n")
+		devnull = open(os.devnull, "w")
+		try:
+			result = subprocess.call([options.pathPdflatex, "-ini", "-jobname=" + name, "&pdflatex", name + ".tex"], cwd=workDir, stdout=devnull, stderr=subprocess.STDOUT)
+		except OSError, e:
+			result = str(e)
+		finally:
+			devnull.close()
+		if result != 0 or not os.path.exists(os.path.join(workDir, name + ".fmt")):
+			LOGGER.warning("Unable to precompile preamble (" + str(result) + "), rendering reports without it")
+			return None
+		shutil.move(os.path.join(workDir, name + ".fmt"), name + ".fmt")
+		LOGGER.info("Precompiled preamble to " + name + ".fmt")
+		return (os.path.abspath(name), static)
+	finally:
+		shutil.rmtree(workDir, ignore_errors=True)
+
+
+
+def render_report(texFile, cacheFile=None, fmt=None):
+	#render a PDF report in a dedicated working directory so that .aux/.log files don't collide
+	name = os.path.splitext(os.path.basename(texFile))[0]
+	targetDir = os.path.dirname(os.path.abspath(texFile))
+	workDir = tempfile.mkdtemp(prefix="satprep-")
+	try:
+		command = [options.pathPdflatex, "--interaction=batchmode", os.path.abspath(texFile)]
+		if fmt is not None:
+			with open(texFile, "r") as f:
+				(static, dynamic, document) = split_preamble(f.read())
+			if static == fmt[1]:
+				#packages are loaded from the format file
+				with open(os.path.join(workDir, name + ".tex"), "w") as f:
+					f.write(dynamic + document)
+				command = [options.pathPdflatex, "-fmt=" + fmt[0], "--interaction=batchmode", name + ".tex"]
+			else:
+				fmt = None
+		devnull = open(os.devnull, "w")
+		try:
+			result = subprocess.call(command, cwd=workDir, stdout=devnull, stderr=subprocess.STDOUT)
+		except OSError, e:
+			LOGGER.error("Unable to run pdflatex for report '" + name + "': " + str(e))
+			return False
+		finally:
+			devnull.close()
+		success = result == 0 and os.path.exists(os.path.join(workDir, name + ".pdf"))
+		if not success and fmt is not None:
+			LOGGER.debug("Unable to render report '" + name + "' using precompiled preamble, trying again without it")
+			return render_report(texFile, cacheFile)
+		#keep TeX and log files of failed reports
+		if options.preserveTex or not success:
+			suffixes = ["pdf", "aux", "log", "out"]
+		else:
+			suffixes = ["pdf"]
+			if options.debug: LOGGER.debug("Removing "+name+".[tex|aux|log|out] files")
+			os.remove(texFile)
+		for suffix in suffixes:
+			if os.path.exists(os.path.join(workDir, name + "." + suffix)):
+				shutil.move(os.path.join(workDir, name + "." + suffix), os.path.join(targetDir, name + "." + suffix))
+		if success and cacheFile:
+			#rename to make sure that other jobs only find complete files
+			(handle, tempFile) = tempfile.mkstemp(dir=options.renderCache)
+			os.close(handle)
+			shutil.copyfile(os.path.join(targetDir, name + ".pdf"), tempFile)
+			os.rename(tempFile, cacheFile)
+		if not success:
+			LOGGER.error("Unable to render report '" + name + "' (pdflatex exit code " + str(result) + "), see " + os.path.join(targetDir, name + ".log"))
+		return success
+	finally:
+		shutil.rmtree(workDir, ignore_errors=True)
+
+
+
+def render_reports(texFiles, jobs=1):
+	#render PDF reports using multiple pdflatex processes
+	start = time.time()
+	queue = Queue.Queue()
+	for texFile in texFiles:
+		queue.put(texFile)
+	salt = None
+	if options.renderCache:
+		if not os.path.isdir(options.renderCache):
+			os.makedirs(options.renderCache)
+		salt = get_render_cache_salt()
+	fmt = None
+	if options.precompilePreamble and len(texFiles) > 0:
+		fmt = create_format(texFiles[0])
+	failed = []
+	cached = []
+	def work():
+		while True:
+			try:
+				texFile = queue.get_nowait()
+			except Queue.Empty:
+				return
+			cacheFile = None
+			if salt is not None:
+				cacheFile = get_render_cache_file(texFile, salt)
+				if os.path.exists(cacheFile):
+					#report didn't change since it was rendered
+					name = os.path.splitext(texFile)[0]
+					if options.debug: LOGGER.debug("Using cached report " + cacheFile + " for " + name)
+					shutil.copyfile(cacheFile, name + ".pdf")
+					if options.preserveTex == False: os.remove(texFile)
+					cached.append(texFile)
+					continue
+			if not render_report(texFile, cacheFile, fmt): failed.append(texFile)
+	workers = [threading.Thread(target=work) for i in range(min(jobs, len(texFiles)))]
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+	LOGGER.info("Rendered {0} of {1} reports ({2} from render cache) in {3:.1f} seconds".format(len(texFiles)-len(failed), len(texFiles), len(cached), time.time()-start))
+	return failed
+
+
+
+def combine_reports(reports):
+	#combine host reports in one document
+	document = [reports[0][:reports[0].index("\\begin{document}")], "\\begin{document}\n"]
+	for report in reports:
+		(static, dynamic, body) = split_preamble(report)
+		if len(document) > 2: document.append("\\clearpage\n")
+		document.append("\\setcounter{page}{1}\n")
+		#repeat preamble commands like headers as they contain host information
+		for line in dynamic.splitlines():
+			if line.startswith("\\"):
+				document.append(line + "\n")
+		document.append(body[len("\\begin{document}"):body.rindex("\\end{document}")])
+	document.append("\\end{document}\n")
+	return "".join(document)
+
+
+
+def write_host_reports(writer, infos):
+	#write one report per host
+	files = []
+	for info in infos:
+		filename = info["hostname"].replace(" ","") + writer.extension
+		with open(filename, "w") as letter:
+			letter.write(writer.render(info))
+		files.append(filename)
+	return files
+
+
+
+def write_combined_reports(writer, infos, name, hostsPerDocument=0):
+	#write reports containing multiple hosts
+	if hostsPerDocument < 1: hostsPerDocument = len(infos)
+	files = []
+	for i in range(0, len(infos), hostsPerDocument):
+		if hostsPerDocument < len(infos):
+			filename = name + "-" + str(i/hostsPerDocument+1) + writer.extension
+		else:
+			filename = name + writer.extension
+		with open(filename, "w") as letter:
+			letter.write(writer.render_all(infos[i:i+hostsPerDocument]))
+		files.append(filename)
+	return files
+
+
+
+def get_delta_cache_file(filename1, filename2):
+	#cached deltas are named after the hashes of both snapshot reports
+	key = hashlib.sha1()
+	for filename in [filename1, filename2]:
+		sha = hashlib.sha1()
+		with open(filename, "rb") as f:
+			for chunk in iter(lambda: f.read(1048576), ""):
+				sha.update(chunk)
+		key.update(sha.hexdigest())
+	return os.path.join(options.deltaCache, key.hexdigest() + ".csv")
+
+
+
+def add_delta_cache_file(deltaFile, cacheFile):
+	#rename to make sure that other runs only find complete files
+	if not os.path.isdir(options.deltaCache):
+		os.makedirs(options.deltaCache)
+	(handle, tempFile) = tempfile.mkstemp(dir=options.deltaCache)
+	os.close(handle)
+	shutil.copyfile(deltaFile, tempFile)
+	os.rename(tempFile, cacheFile)
+
+
+
+def write_delta(filename, header, removed):
+	#write delta CSV report without blank lines and surrounding whitespace
+	f = open(filename, 'w')
+	f.write(header)
+	previous = None
+	count = 0
+	for line in removed:
+		if not line.strip():
+			continue
+		if previous is None:
+			line = line.lstrip()
+		else:
+			f.write(previous)
+		previous = line
+		count = count + 1
+	if previous is not None:
+		f.write(previous.rstrip())
+	f.close()
+	LOGGER.debug("Delta contains {0} lines".format(count))
+
 def parse_options(args=None):
 	if args is None:
 		args = sys.argv
 	
         #define usage, description, version and load parser
-	usage = "usage: %prog [options] snapshot.csv snapshot.csv"
+	usage = "usage: %prog [options] snapshot.csv snapshot.csv\n       %prog [options] -u delta.csv [snapshot.csv snapshot.csv]"
         desc='''%prog is used to create patch diff reports of systems managed with Spacewalk, Red Hat Satellite and SUSE Manager. The script needs TeXlive/LaTeX to create PDF reports. Defining your own templates is possible - the default template needs to be located in the same directory like this script.
 		
 		Checkout the GitHub page for updates: https://github.com/stdevel/satprep'''
@@ -59,9 +778,10 @@ def parse_options(args=None):
 	repOpts.add_option("-t", "--template", dest="template", default="default", metavar="FILE", help="defines the template which is used to generate the report (default: cwd/default.tex)")
         #-o / --output
         repOpts.add_option("-o", "--output", action="store", type="string", dest="output", default="foobar", help="define report filename. (default: errata-diff-report-Ymd.csv)", metavar="FILE")
-	#-u / --use-delta-from
-	#repOpts.add_option("-u", "--use-delta-from", action="store", type="string", dest="deltafile", default="", metavar="FILE", help="defines previously created delta file - useful if you don't want to re-create the delta")
-	#TODO: implement
+	#-u / --use-delta-from, -c / --csv
+	repOpts.add_option("-u", "--use-delta-from", "-c", "--csv", action="store", type="string", dest="deltaFile", default="", metavar="FILE", help="uses a pre-existing CSV delta report instead of creating one, snapshot reports are optional - useful if you don't want to re-create the delta")
+	#-D / --delta-cache
+	repOpts.add_option("-D", "--delta-cache", action="store", type="string", default="", dest="deltaCache", metavar="DIR", help="stores delta reports in DIR and re-uses them if the same snapshot reports are compared again (default: none)")
 	#-n / --no-host-reports
 	repOpts.add_option("-n", "--no-host-reports", action="store_true", default=False, dest="noHostReports", help="only create delta CSV report and skip creating host reports (default: no)")
 	#-x / --preserve-tex
@@ -70,16 +790,33 @@ def parse_options(args=None):
 	repOpts.add_option("-p", "--page-orientation", action="store", type="choice", dest="pageOrientation", default="landscape", metavar="[landscape|potrait]", choices=["landscape","potrait"], help="defines the orientation of the PDF report (default: landscape)")
 	#-i / --image
 	repOpts.add_option("-i", "--image", action="store", type="string", dest="logoImage", metavar="FILE", help="defines a different company logo")
-	#-c / --csv
-	#repOpts.add_option("-c", "--csv", action="store", type="string", dest="csvReport", metavar="FILE", help="uses a pre-existing CSV delta report")
-	#TODO: implement
 	#-f / --footer
 	repOpts.add_option("-f", "--footer", action="store", type="string", default="", dest="footer", metavar="STRING", help="changes footer text")
+	#-B / --benchmark
+	repOpts.add_option("-B", "--benchmark", action="store_true", default=False, dest="benchmark", help="compares the delta engine with difflib.ndiff using the given reports and quits (default: no)")
+	#-F / --format
+	repOpts.add_option("-F", "--format", action="store", type="choice", dest="reportFormat", default="latex", metavar="[latex|html|markdown|json]", choices=["latex","html","markdown","json"], help="defines the format of the host reports, only latex requires pdflatex and the template (default: latex)")
+	#-a / --all-in-one
+	repOpts.add_option("-a", "--all-in-one", action="store_true", default=False, dest="allInOne", help="creates one document containing all host reports instead of one per host (default: no)")
+	#-H / --hosts-per-document
+	repOpts.add_option("-H", "--hosts-per-document", action="store", type="int", default=0, dest="hostsPerDocument", metavar="NUMBER", help="splits the --all-in-one document into documents of NUMBER hosts (default: 0, one document)")
+	#-P / --precompile-preamble
+	repOpts.add_option("-P", "--precompile-preamble", action="store_true", default=False, dest="precompilePreamble", help="dumps document class and packages of the template into a format file once and re-uses it for every report (default: no)")
+	#-j / --jobs
+	repOpts.add_option("-j", "--jobs", action="store", type="int", default=1, dest="jobs", metavar="NUMBER", help="defines how many PDF reports are rendered in parallel (default: 1)")
+	#-C / --render-cache
+	repOpts.add_option("-C", "--render-cache", action="store", type="string", default="", dest="renderCache", metavar="DIR", help="stores rendered PDF reports in DIR and re-uses them for hosts whose report didn't change (default: none)")
+	#-m / --low-memory
+	repOpts.add_option("-m", "--low-memory", action="store_true", default=False, dest="lowMemory", help="sorts and compares the reports on disk instead of in memory, useful for very large reports (default: no)")
+	#-S / --sort-buffer
+	repOpts.add_option("-S", "--sort-buffer", action="store", type="int", default=100000, dest="sortBuffer", metavar="LINES", help="defines how many lines are sorted in memory at once if --low-memory is used (default: 100000)")
 	#-V / --verification-log
 	repOpts.add_option("-V", "--verification-log", action="store", default="", dest="verificationLog", metavar="FILE", help="alternate location for verification log (default: $lastSnapshot.vlog)")
 	
         #parse and return arguments
         (options, args) = parser.parse_args()
+	if options.jobs < 1:
+		parser.error("number of jobs needs to be 1 or higher")
 	return (options, args)
 
 
@@ -95,6 +832,9 @@ def main(options):
 	if options.footer == "":
 		#default footer
 		options.footer = 'This report was automatically generated by \\textbf{satprep} - \href{https://github.com/stdevel/satprep}{https://github.com/stdevel/satprep}'
+	#reports are created in /tmp
+	if options.renderCache: options.renderCache = os.path.abspath(options.renderCache)
+	if options.deltaCache: options.deltaCache = os.path.abspath(options.deltaCache)
 	#set default logo if none specified or not readable
 	if options.logoImage is None or not os.access(os.path.dirname(options.logoImage), os.R_OK):
 		if options.logoImage: LOGGER.error("given logo image (" + str(options.logoImage) + ") not readable, using default logo (" + thisFolder + "/default_logo.jpg" + ")")
@@ -105,19 +845,28 @@ def main(options):
 	if options.debug: LOGGER.debug("options:"+str(options)+"\nargs: "+str(args))
 	
 	#check whether two arguments containing (the report files) are given
-	#TODO: check if delta report specified with -c / --csv
-	if len(args) != 2:
+	if len(args) != 2 and not (options.deltaFile and len(args) == 0):
 		LOGGER.error("You need to specify two files (snapshot reports!)")
 		exit(1)
+	if options.deltaFile and len(args) == 0 and options.verificationLog == "":
+		LOGGER.error("You need to specify a verification log (-V) if no snapshot reports are given!")
+		exit(1)
 	
 	#check whether report lines are compatible
-	file1 = open(args[0], 'r')
-	header = file1.readline()
-	file2 = open(args[1], 'r')
-	if header == file2.readline():
+	if options.deltaFile:
+		#only read the header of the delta, snapshots are not compared
+		file1 = [iter_report(options.deltaFile).next()]
+		file2 = file1
+	elif options.lowMemory or options.benchmark or options.deltaCache:
+		#only read headers, reports are read again later
+		file1 = [iter_report(args[0]).next()]
+		file2 = [iter_report(args[1]).next()]
+	else:
+		file1 = read_report(args[0])
+		file2 = read_report(args[1])
+	header = file1[0]
+	if header == file2[0]:
 		if options.debug: LOGGER.debug("report headers are compatible!")
-		file1.seek(0)
-		file2.seek(0)
 		#setup field indexes
 		headers = header.replace("\n","").replace("\r","").split(";")
 		#print header
@@ -133,28 +882,29 @@ def main(options):
 		LOGGER.debug("Your reports are incompatible as they have different columns!")
 		exit(1)
 	
+	if options.benchmark and len(args) == 2:
+		if benchmark_delta(args[0], args[1], options.sortBuffer): exit(0)
+		else: exit(1)
+	
 	#check whether the pdflatex exists
-	if not os.access(options.pathPdflatex, os.X_OK):
+	if options.reportFormat == "latex" and not os.access(options.pathPdflatex, os.X_OK):
 		LOGGER.error("pdflatex binary (" + options.pathPdflatex + ") not existent or executable!")
 		exit(1)
 	
 	#check whether the template exists
-	if os.path.isfile(thisFolder+"/"+options.template+".tex"):
+	if options.reportFormat != "latex" or os.path.isfile(thisFolder+"/"+options.template+".tex"):
 		if options.debug: LOGGER.debug("Template exists!")
 		
 		#check whether target is writable
 		if os.access(os.path.dirname(options.output), os.W_OK) or os.access(os.getcwd(), os.W_OK):
                         if options.debug: LOGGER.debug("Path exists and writable")
 			
-			#read reports and create delta
-			if os.path.getctime(args[0]) < os.path.getctime(args[1]):
+			if len(args) == 0:
+				#delta without snapshots
+				this_date = datetime.datetime.fromtimestamp(os.path.getmtime(options.deltaFile)).strftime('%Y-%m-%d')
+			elif os.path.getctime(args[0]) < os.path.getctime(args[1]):
 				#file1 is bigger
 				LOGGER.info("Assuming file1 ('"+args[0]+"') is the first snapshot.")
-				f1 = file1.readlines()
-				f2 = file2.readlines()
-				f1.sort()
-				f2.sort()
-				diff = difflib.ndiff(f1, f2)
 				this_date = datetime.datetime.fromtimestamp(os.path.getmtime(args[1])).strftime('%Y-%m-%d')
 				#set vlog
 				if options.verificationLog == "":
@@ -162,11 +912,6 @@ def main(options):
 			else:
 				#file2 is bigger
 				LOGGER.info("Assuming file2 ('"+args[1]+"') is the first snapshot.")
-				f1 = file1.readlines()
-                                f2 = file2.readlines()
-                                f1.sort()
-                                f2.sort()
-				diff = difflib.ndiff(f1, f2)
 				this_date = datetime.datetime.fromtimestamp(os.path.getmtime(args[0])).strftime('%Y-%m-%d')
 				#set vlog
 				if options.verificationLog == "":
@@ -181,19 +926,26 @@ def main(options):
 			vlog = [x.strip('\n') for x in vlog]
 			LOGGER.debug("vlog is:\n" + str(vlog))
 			
-			#create delta
-			delta = ''.join(x[2:] for x in diff if x.startswith('- '))
-			delta = "".join([s for s in delta.strip().splitlines(True) if s.strip("\r\n").strip()])
-			
-			#print delta
-			if options.debug: LOGGER.debug("Delta is:\n"+delta)
-			
 			#create diff CSV report
-			f = open( options.output+'.csv', 'w' )
-			f.write(header)
-			for line in delta:
-				f.write(line)
-			f.close()
+			if options.deltaFile:
+				LOGGER.info("Using delta '" + options.deltaFile + "' instead of creating one")
+				deltaFile = os.path.abspath(options.deltaFile)
+			else:
+				deltaFile = os.path.abspath(options.output+'.csv')
+				if options.deltaCache: cacheFile = get_delta_cache_file(args[0], args[1])
+				if options.deltaCache and os.path.exists(cacheFile):
+					LOGGER.info("Re-using cached delta '" + cacheFile + "'")
+					shutil.copyfile(cacheFile, deltaFile)
+				else:
+					#read reports and create delta
+					if options.lowMemory:
+						removed = get_removed_lines_sorted(sort_report(args[0], options.sortBuffer), sort_report(args[1], options.sortBuffer))
+					else:
+						if len(file1) == 1: file1 = read_report(args[0])
+						if len(file2) == 1: file2 = read_report(args[1])
+						removed = get_removed_lines(file1, file2)
+					write_delta(deltaFile, header, removed)
+					if options.deltaCache: add_delta_cache_file(deltaFile, cacheFile)
 			
 			#stop here if user doesn't want any fancy host reports
 			if options.noHostReports:
@@ -210,254 +962,38 @@ def main(options):
                         #switch to /tmp directory
                         os.chdir("/tmp")
 			
-			#read CSV as array
-			a = []
-			if options.debug: LOGGER.debug("Opening file '" + options.output+'.csv' + "'")
-			csvReader = csv.reader(open(thisFolder+"/"+options.output+'.csv', 'r'), delimiter=';');
-			for row in csvReader:
-				a.append(row);
-			
-			#create array with hosts
+			#read CSV and group rows by host in one pass, keeping the order of hosts
 			hosts = []
-			for i in range(0, len(a)):
-				if str(a[i][0]) not in hosts and str(a[i][0]) != "hostname":
-					hosts.append(a[i][0])
+			hostRows = {}
+			if options.debug: LOGGER.debug("Opening file '" + deltaFile + "'")
+			csvReader = csv.reader(open(deltaFile, 'r'), delimiter=';');
+			for row in csvReader:
+				if len(row) == 0 or row[0] == "hostname": continue
+				if row[0] not in hostRows:
+					hosts.append(row[0])
+					hostRows[row[0]] = []
+				hostRows[row[0]].append(row)
 			
-			#open TeX template
-			with open (thisFolder+"/"+options.template+".tex", "r") as template:
-				data=template.read()
-				template.close()
+			#collect host information once, it is used by all report formats
+			columns = [column for column in repcols if column.find("errata") != -1]
+			infos = [get_host_info(host, hostRows[host], repcols, vlog, this_date) for host in hosts]
+			if options.reportFormat == "latex":
+				#open TeX template and parse it once
+				with open (thisFolder+"/"+options.template+".tex", "r") as f:
+					writer = LaTeXReport(columns, CompiledTemplate(f.read()))
+			else:
+				writer = REPORT_FORMATS[options.reportFormat](columns)
 			
-			#create patch report per host
-			for host in hosts:
-				#scan imported data
-				
-				#pre-setting some variables
-				this_NoReboot="$\Box$"
-				this_RebootNotes=""
-				this_monYes="$\Box$"
-				this_monNo="$\Box$"
-				
-				#LaTeX line including the the errata-relevant columns for this host
-				thisColDescriptor=""
-				
-				#LaTeX lines for the table
-				this_errataTable="\section*{}"
-				this_errataTable=this_errataTable + "\n" + '\\begin{tabularx}{\\textwidth}{%%colDescriptor}'
-				this_errataTable=this_errataTable + "\n" + '\hline'
-				this_errataTable=this_errataTable + "\n" + '\multicolumn{%%count}{|c|}{\cellcolor{Gray}\\textbf{List of installed patches}} \\\\'
-				this_errataTable=this_errataTable + "\n" + '\\hline'
-				
-				#set multicolumn counter (table header)
-				this_errataColumns = [row for row in repcols if row.find("errata") != -1]
-				this_errataTable = this_errataTable.replace("%%count", str(len(this_errataColumns)))
-				
-				#set LaTeX column descriptor (table header)
-				for i in range(0, len(this_errataColumns)):
-					if this_errataColumns[i] == "errata_desc" or this_errataColumns[i] == "errata_name":
-						thisColDescriptor = thisColDescriptor + " | X"
-					else:
-						thisColDescriptor = thisColDescriptor + " | l"
-				thisColDescriptor = thisColDescriptor + " | "
-				this_errataTable = this_errataTable.replace("%%colDescriptor", thisColDescriptor)
-				
-				#add LaTeX columns (table header)
-				tempRow="\n"
-				count=1
-				for row in this_errataColumns:
-					#avoid & if last column
-					tempRow=tempRow + '\\textbf{' + row + '} '
-					if count != len(this_errataColumns): tempRow = tempRow + '& '
-					count = count +1
-				#end column row and replace variable names with human-readable names
-				tempRow = tempRow + '\\\\'
-				tempRow = tempRow.replace("errata_name", "Name").replace("errata_date", "Date").replace("errata_desc","Description").replace("errata_reboot", "Reboot required").replace("errata_type", "Type")
-				this_errataTable = this_errataTable + tempRow
-				
-				#read the diff file content sequentially (Yeah I know that this is pretty bad)
-				this_errata_name=[]
-				this_errata_date=[]
-				this_errata_desc=[]
-				this_errata_reboot=[]
-				this_errata_type=[]
-				for line in a:
-						#check if the current line is host-relevant
-						if line[0] == host:
-							if options.debug: LOGGER.debug("Found relevant line for " + host + ": " + str(line))
-							#define IP address if present in report
-							if repcols["ip"] < 666:
-								this_ip = line[repcols["ip"]]
-								this_host = host + "\n(" + line[repcols["ip"]] + ")"
-							else:
-								#just set host
-								this_host = host
-								this_ip = ""
-							
-							#set owner if present in report
-							if repcols["system_owner"] < 666:
-								this_owner = line[repcols["system_owner"]]
-								this_owner = this_owner.replace('%%nl', '\newline')
-							else:
-								this_owner = ""
-							
-							#set system cluster bit if specified and present in report
-				                        if repcols["system_cluster"] < 666 and line[repcols["system_cluster"]] == "1":
-								#set cluster/standalone boxes
-								this_cluster = "$\CheckedBox$"
-								this_standalone = "$\Box$"
-								hintsClTest=""
-                                                        else:
-								#set cluster/standalone boxes
-                                                                this_cluster = "$\Box$"
-								this_standalone = "$\CheckedBox$"
-								hintsClTest="not a cluster system"
-							
-							#set system monitoring bit if specified and present in report
-							if repcols["system_monitoring"] < 666 and line[repcols["system_monitoring"]] == "0":
-								#no monitoring, add notes if available
-								this_monYes = "$\Box$"
-								this_monNo = "$\CheckedBox$"
-                                                                this_monSchedNo = "$\CheckedBox$"
-							else:
-								#set box/comment if downtime scheduled
-								if repcols["system_monitoring_name"] < 666 and line[repcols["system_monitoring_name"]] != "":
-									tempHost = line[repcols["system_monitoring_name"]]
-									if "@" in tempHost: tempHost = tempHost[:tempHost.find("@")]
-								else: tempHost = host
-								if str("MONOK;"+tempHost) in vlog:
-									LOGGER.debug("MONOK;"+tempHost+" in vlog!")
-									this_monYes = "$\CheckedBox$"
-									this_monNo = "$\Box$"
-								else:
-									LOGGER.debug("MONOK;"+tempHost+" NOT in vlog!")
-									this_monYes = "$\Box$"
-									this_monNo = "$\CheckedBox$"
-							if repcols["system_monitoring_notes"] < 666 and len(line[repcols["system_monitoring_notes"]]) > 1:
-                                                               	this_monNotes = line[repcols["system_monitoring_notes"]]
-							else: this_monNotes = ""
-							
-                                                        #set system backup bit if specified and present in report
-                                                        if repcols["system_backup"] < 666 and line[repcols["system_backup"]] == "0":
-                                                                #no backup, add notes if available
-                                                                this_backupNo = "$\CheckedBox$"
-                                                                if repcols["system_backup_notes"] < 666 and len(line[repcols["system_backup_notes"]]) > 1:
-                                                                        this_backupNoNotes = line[repcols["system_backup_notes"]]
-                                                                else:
-                                                                        this_backupNoNotes = ""
-                                                        else:
-                                                                this_backupNo = "$\Box$"
-                                                                this_backupNoNotes = ""
-
-                                                        #set system antivir bit if specified and present in report
-                                                        if repcols["system_antivir"] < 666 and line[repcols["system_antivir"]] == "0":
-                                                                #no antivirus, add notes if available
-                                                                this_antivirNo = "$\CheckedBox$"
-                                                                if repcols["system_antivir_notes"] < 666 and len(line[repcols["system_antivir_notes"]]) > 1:
-                                                                        this_antivirNoNotes = line[repcols["system_antivir_notes"]]
-                                                                else:
-                                                                        this_antivirNoNotes = ""
-                                                        else:
-                                                                this_antivirNo = "$\Box$"
-                                                                this_antivirNoNotes = ""
-
-							#set system virtualization bit if specified and present in report
-                                                        if repcols["system_virt"] < 666 and line[repcols["system_virt"]] == "1":
-								#set boxes and notes
-                                                                this_hwCheckNo = "$\CheckedBox$"
-								this_hwCheckNotes = "not a physical host"
-								this_vmSnapNotes = ""
-								#set box/comment if snapshot created
-								if repcols["system_virt_vmname"] < 666 and line[repcols["system_virt_vmname"]] != "":
-									tempHost = line[repcols["system_virt_vmname"]]
-									if "@" in tempHost: tempHost = tempHost[:tempHost.find("@")]
-								else: tempHost = host
-								if "SNAPOK;"+tempHost in vlog:
-									LOGGER.debug("SNAPOK;"+tempHost + " in vlog!")
-									this_vmSnapYes = "$\CheckedBox$"
-									this_vmSnapNo = "$\Box$"
-								else:
-									LOGGER.debug("SNAPOK;"+tempHost + " NOT in vlog!")
-									this_vmSnapYes = "$\Box$"
-									this_vmSnapNo = "$\CheckedBox$"
-                                                        else:  
-								#set boxes and notes
-								this_hwCheckNo = "$\Box$"
-								this_vmSnapYes = "$\Box$"
-								this_vmSnapNo = "$\CheckedBox$"
-								this_hwCheckNotes = ""
-								this_vmSnapNotes ="not a virtual machine"
-							
-							#set errata information
-							if repcols["errata_name"] < 666 and line[repcols['errata_name']] != "":
-								this_errata_name.append(line[repcols["errata_name"]])
-							if repcols["errata_date"] < 666 and line[repcols['errata_date']] != "":
-								this_errata_date.append(line[repcols["errata_date"]])
-							if repcols["errata_desc"] < 666 and line[repcols["errata_desc"]] != "":
-								this_errata_desc.append(line[repcols["errata_desc"]])
-							if repcols["errata_type"] < 666 and line[repcols["errata_type"]] != "":
-								this_errata_type.append(line[repcols["errata_type"]])
-							if repcols["errata_reboot"] < 666 and line[repcols["errata_reboot"]] != "":
-								this_errata_reboot.append(line[repcols["errata_reboot"]])
-							
-				#set reboot box if specified and present in report
-				rebootErrata = [s for e in this_errata_reboot if e == "1"]
-				if len(rebootErrata) == 0:
-					this_NoReboot="$\CheckedBox$"
-					this_RebootNotes="no reboot required"
-				
-                                #add errata
-				tempRow=""
-				for i in range(0, len(this_errata_name)):
-                                	count=1
-	                                for row in this_errataColumns:
-        	                                #avoid & if last column
-                	                        tempRow=tempRow +  row + " "
-                        	                if count != len(this_errataColumns): tempRow = tempRow + ' & '
-                                	        count = count +1
-	                                #end column row and replace variable names with human-readable names
-        	                        tempRow = tempRow + "\\\\" + "\n"
-                	                tempRow = tempRow.replace("errata_name", this_errata_name[i])
-					if repcols["errata_date"] < 666:
-						 tempRow = tempRow.replace("errata_date", this_errata_date[i])
-					else:
-						tempRow = tempRow.replace("errata_date", "unknown ")
-					if repcols["errata_desc"] < 666:
-						tempRow = tempRow.replace("errata_desc", this_errata_desc[i])
-					else:
-						tempRow = tempRow.replace("errata_desc", "unknown ")
-					if repcols["errata_reboot"] < 666:
-						if this_errata_reboot[i] == "1":
-							tempRow = tempRow.replace("errata_reboot", "yes")
-						else:
-							tempRow = tempRow.replace("errata_reboot", "no")
-					else:
-						tempRow = tempRow.replace("errata_reboot", "unknown ")
-					if repcols["errata_type"] < 666:
-						tempRow = tempRow.replace("errata_type", this_errata_type[i])
-					else:
-						tempRow = tempRow.replace("errata_type", "unknown ")
-				
-				tempRow = tempRow.replace("_", "\_")
-                                this_errataTable = this_errataTable + "\n" + tempRow
-
-                                #print table footer
-                                this_errataTable = this_errataTable + "\n" + '\hline' + "\n" + '\end{tabularx}'
-				
-				#Write LaTeX file
-				with open (host.replace(" ","") + ".tex", "w") as letter:
-					s = LaTeXTemplate(data)
-					#Substitute template variables
-					letter.write(s.substitute(titleHostname=host, ip=this_ip, date=this_date, owner=this_owner, systemStandalone=this_standalone, systemCluster=this_cluster, hintsClusterTest=hintsClTest, hwCheckNo=this_hwCheckNo, hwCheckNotes=this_hwCheckNotes, vmSnapYes=this_vmSnapYes, vmSnapNo=this_vmSnapNo, vmSnapNotes=this_vmSnapNotes, rebootNo=this_NoReboot, rebootNotes=this_RebootNotes, errata=this_errataTable, orientation=options.pageOrientation+",", footer=options.footer, logo=options.logoImage, monSchedYes=this_monYes, monSchedNo=this_monNo, monSchedNotes=this_monNotes, BackupNo=this_backupNo, BackupNoNotes=this_backupNoNotes, AntivirNo=this_antivirNo, AntivirNoNotes=this_antivirNoNotes))
-					letter.close();
-					#render PDF files
-					os.system(options.pathPdflatex + " %s %s 1>/dev/null" % ("--interaction=batchmode",  host.replace(" ","") + ".tex"))
-					#remove .tex/.aux/.log file
-					if options.preserveTex == False:
-						if options.debug: LOGGER.debug("Removing "+host+".[tex|aux|log|out] files")
-						os.remove(host.replace(" ","") + ".tex")
-						os.remove(host.replace(" ","") + ".aux")
-						os.remove(host.replace(" ","") + ".log")
-						os.remove(host.replace(" ","") + ".out")
+			#create patch report per host or combined reports
+			if options.allInOne:
+				files = write_combined_reports(writer, infos, os.path.basename(options.output), options.hostsPerDocument)
+			else:
+				files = write_host_reports(writer, infos)
+			if options.reportFormat == "latex":
+				#render PDF files
+				render_reports(files, options.jobs)
+			else:
+				LOGGER.info("Created " + str(len(files)) + " " + options.reportFormat + " reports for " + str(len(infos)) + " hosts")
 		else:   
 			#path not writable or existent
 			LOGGER.error("Path non-existent or non-writable!")
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# satprep_fake_monitoring.py - a script for simulating the
+# Nagios/Icinga CGIs, MK Livestatus and the Icinga2 REST API
+# to test the monitoring integration of the satprep toolkit offline.
+#
+# 2015 By Christian Stankowic
+# <info at stankowic hyphen development dot net>
+# https://github.com/stdevel
+#
+
+import BaseHTTPServer
+import json
+import logging
+import os
+import SocketServer
+import sys
+import threading
+import time
+import urllib
+import urlparse
+from optparse import OptionParser, OptionGroup
+
+
+
+#set logger
+LOGGER = logging.getLogger('satprep_fake_monitoring')
+
+
+
+class FakeMonitoring(object):
+	#keeps downtimes of a synthetic host landscape, all hosts are members of the hostgroup 'all'
+	def __init__(self, hosts, latency=0.0, downtimes=None):
+		if downtimes is None:
+			downtimes = []
+		self.latency = latency
+		self.hosts = ["host{0:04d}.localdomain".format(i) for i in range(hosts)]
+		self.downtimes = {}
+		self.calls = {}
+		self.lock = threading.Lock()
+		for host in downtimes:
+			self.add_downtime(host)
+
+	def count(self, request):
+		with self.lock:
+			self.calls[request] = self.calls.get(request, 0) + 1
+
+	def wait(self):
+		#simulate network latency once per request or Livestatus connection
+		if self.latency:
+			time.sleep(self.latency)
+
+	def get_hosts(self, names=None, hostgroup=None):
+		#get existing hosts, optionally filtered by name or hostgroup
+		if hostgroup is not None and hostgroup != "all": return []
+		if names is None: return list(self.hosts)
+		return [host for host in self.hosts if host in names]
+
+	def get_downtime_hosts(self):
+		with self.lock:
+			return sorted(self.downtimes)
+
+	def add_downtime(self, host):
+		with self.lock:
+			self.downtimes[host] = self.downtimes.get(host, 0) + 1
+
+	def remove_downtimes(self, host):
+		with self.lock:
+			self.downtimes.pop(host, None)
+
+
+
+class FakeHTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	#Nagios/Icinga CGIs and Icinga2 REST API, connections are kept alive
+	protocol_version = "HTTP/1.1"
+
+	def log_message(self, format, *args):
+		LOGGER.debug(format % args)
+
+	def reply(self, code, body, type="text/html"):
+		self.send_response(code)
+		self.send_header("Content-Type", type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def reply_json(self, code, data):
+		self.reply(code, json.dumps(data), "application/json")
+
+	def do_GET(self):
+		self.server.monitoring.wait()
+		path = urlparse.urlparse(self.path).path
+		if path == "/cgi-bin/status.cgi":
+			self.server.monitoring.count("cgi status")
+			rows = ["<tr><td class='statusHOSTDOWNTIME'><a href='extinfo.cgi?type=1&host={0}'>{1}</a></td></tr>".format(urllib.quote_plus(host), host) for host in self.server.monitoring.get_downtime_hosts()]
+			self.reply(200, "<html><body><table class='status'>\n" + "\n".join(rows) + "\n</table></body></html>")
+		else:
+			self.reply(404, "<html><body>Not found</body></html>")
+
+	def do_POST(self):
+		self.server.monitoring.wait()
+		path = urlparse.urlparse(self.path).path
+		data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		if path == "/cgi-bin/cmd.cgi":
+			self.do_cmd(urlparse.parse_qs(data))
+		elif path.startswith("/v1/"):
+			try:
+				data = json.loads(data)
+			except ValueError:
+				return self.reply_json(400, {"error": 400, "status": "Invalid request body"})
+			if path == "/v1/objects/hosts": self.do_objects(data)
+			elif path == "/v1/actions/schedule-downtime": self.do_schedule(data)
+			elif path == "/v1/actions/remove-downtime": self.do_remove(data)
+			else: self.reply_json(404, {"error": 404, "status": "Object not found."})
+		else:
+			self.reply(404, "<html><body>Not found</body></html>")
+
+	#CGI
+	def do_cmd(self, form):
+		monitoring = self.server.monitoring
+		command = form.get("cmd_typ", [""])[0]
+		monitoring.count("cgi cmd " + command)
+		if command == "85":
+			hosts = monitoring.get_hosts(hostgroup=form.get("hostgroup", [""])[0])
+		else:
+			hosts = monitoring.get_hosts([form.get("host", [""])[0]])
+		if command not in ["55", "171", "85"] or len(hosts) == 0:
+			return self.reply(200, "<html><body><div class='errorMessage'>Error: Could not find host or hostgroup</div></body></html>")
+		for host in hosts:
+			if command == "171": monitoring.remove_downtimes(host)
+			else: monitoring.add_downtime(host)
+		self.reply(200, "<html><body><div class='infoMessage'>Your command request was successfully submitted for processing.</div></body></html>")
+
+	#ICINGA2 API
+	def filter_hosts(self, data):
+		#supports the filters used by satprep only
+		monitoring = self.server.monitoring
+		filter = data.get("filter", "")
+		vars = data.get("filter_vars", {})
+		if filter == "": return monitoring.get_hosts()
+		elif filter == "host.downtime_depth > 0": return monitoring.get_downtime_hosts()
+		elif filter == "host.name in hosts": return monitoring.get_hosts(vars.get("hosts", []))
+		elif filter == "hostgroup in host.groups": return monitoring.get_hosts(hostgroup=vars.get("hostgroup", ""))
+		raise ValueError("Unsupported filter '{0}'".format(filter))
+
+	def do_objects(self, data):
+		self.server.monitoring.count("icinga2 objects/hosts")
+		try:
+			hosts = self.filter_hosts(data)
+		except ValueError, e:
+			return self.reply_json(400, {"error": 400, "status": str(e)})
+		self.reply_json(200, {"results": [{"name": host, "type": "Host", "attrs": {"name": host}, "joins": {}, "meta": {}} for host in hosts]})
+
+	def do_schedule(self, data):
+		monitoring = self.server.monitoring
+		monitoring.count("icinga2 actions/schedule-downtime")
+		try:
+			hosts = self.filter_hosts(data)
+		except ValueError, e:
+			return self.reply_json(400, {"error": 400, "status": str(e)})
+		if len(hosts) == 0:
+			return self.reply_json(404, {"error": 404, "status": "No objects found."})
+		results = []
+		for host in hosts:
+			monitoring.add_downtime(host)
+			name = "{0}!satprep-{1}".format(host, int(time.time()))
+			results.append({"code": 200.0, "legacy_id": len(results) + 1, "name": name, "status": "Successfully scheduled downtime '{0}' for object '{1}'.".format(name, host)})
+		self.reply_json(200, {"results": results})
+
+	def do_remove(self, data):
+		monitoring = self.server.monitoring
+		monitoring.count("icinga2 actions/remove-downtime")
+		try:
+			hosts = self.filter_hosts(data)
+		except ValueError, e:
+			return self.reply_json(400, {"error": 400, "status": str(e)})
+		if len(hosts) == 0:
+			return self.reply_json(404, {"error": 404, "status": "No objects found."})
+		for host in hosts:
+			monitoring.remove_downtimes(host)
+		self.reply_json(200, {"results": [{"code": 200.0, "status": "Successfully removed all downtimes for object '{0}'.".format(host)} for host in hosts]})
+
+
+
+class FakeLivestatusHandler(SocketServer.StreamRequestHandler):
+	#MK Livestatus, requests are separated by empty lines and answered until the client closes its side
+	def handle(self):
+		self.server.monitoring.wait()
+		for request in self.rfile.read().split("\n\n"):
+			lines = [line for line in request.split("\n") if line != ""]
+			if len(lines) == 0: continue
+			LOGGER.debug("Livestatus request: {0}".format(lines))
+			if lines[0].startswith("COMMAND "): self.do_command(lines[0])
+			elif lines[0].startswith("GET "): self.do_get(lines)
+			else: self.answer(lines, 400, "Invalid request method")
+
+	def answer(self, lines, code, body):
+		if "ResponseHeader: fixed16" in lines: self.wfile.write("{0:3d} {1:11d}\n".format(code, len(body)+1))
+		self.wfile.write(body + "\n")
+
+	def do_get(self, lines):
+		monitoring = self.server.monitoring
+		table = lines[0][4:].strip()
+		monitoring.count("livestatus GET " + table)
+		if table not in ["hosts", "hostgroups"]:
+			return self.answer(lines, 404, "Invalid GET request, no such table '{0}'".format(table))
+		names = []
+		downtime = False
+		for line in lines[1:]:
+			if line.startswith("Filter: name = "): names.append(line[15:])
+			elif line == "Filter: scheduled_downtime_depth > 0": downtime = True
+			elif line.startswith("Filter: "): return self.answer(lines, 400, "Unsupported filter '{0}'".format(line[8:]))
+		if table == "hostgroups": objects = ["all"]
+		elif downtime: objects = monitoring.get_downtime_hosts()
+		else: objects = monitoring.get_hosts()
+		if len(names) > 0: objects = [name for name in objects if name in names]
+		self.answer(lines, 200, json.dumps([[name] for name in objects]))
+
+	def do_command(self, line):
+		#COMMAND [timestamp] NAME;arguments
+		monitoring = self.server.monitoring
+		command = line[line.find("]")+1:].strip().split(";")
+		monitoring.count("livestatus COMMAND " + command[0])
+		if command[0] == "SCHEDULE_HOST_DOWNTIME": hosts = monitoring.get_hosts([command[1]])
+		elif command[0] == "DEL_DOWNTIME_BY_HOST_NAME": hosts = monitoring.get_hosts([command[1]])
+		elif command[0] in ["SCHEDULE_HOSTGROUP_HOST_DOWNTIME", "SCHEDULE_HOSTGROUP_SVC_DOWNTIME"]: hosts = monitoring.get_hosts(hostgroup=command[1])
+		else:
+			LOGGER.warning("Unsupported command '{0}'".format(command[0]))
+			return
+		for host in hosts:
+			if command[0] == "DEL_DOWNTIME_BY_HOST_NAME": monitoring.remove_downtimes(host)
+			elif command[0] != "SCHEDULE_HOSTGROUP_SVC_DOWNTIME": monitoring.add_downtime(host)
+
+
+
+class FakeHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+
+
+class FakeLivestatusServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+
+
+class FakeLivestatusSocketServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+	daemon_threads = True
+
+
+
+def main(options):
+	monitoring = FakeMonitoring(options.hosts, options.latency/1000.0, options.downtimes)
+	servers = [FakeHTTPServer((options.address, options.port), FakeHTTPHandler)]
+	LOGGER.info("Simulating {0} hosts on http://{1}:{2} (CGIs and Icinga2 API)".format(options.hosts, options.address, options.port))
+	if options.livestatusPort:
+		servers.append(FakeLivestatusServer((options.address, options.livestatusPort), FakeLivestatusHandler))
+		LOGGER.info("Simulating Livestatus on {0}:{1}".format(options.address, options.livestatusPort))
+	if options.livestatusSocket != "":
+		if os.path.exists(options.livestatusSocket): os.remove(options.livestatusSocket)
+		servers.append(FakeLivestatusSocketServer(options.livestatusSocket, FakeLivestatusHandler))
+		LOGGER.info("Simulating Livestatus on {0}".format(options.livestatusSocket))
+	for server in servers:
+		server.monitoring = monitoring
+	threads = [threading.Thread(target=server.serve_forever) for server in servers[1:]]
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+	try:
+		servers[0].serve_forever()
+	except KeyboardInterrupt:
+		#print statistics
+		for request in sorted(monitoring.calls):
+			LOGGER.info("{0}: {1} requests".format(request, monitoring.calls[request]))
+		LOGGER.info("{0} hosts in downtime".format(len(monitoring.get_downtime_hosts())))
+	if options.livestatusSocket != "" and os.path.exists(options.livestatusSocket): os.remove(options.livestatusSocket)
+
+
+
+def parse_options(args=None):
+	if args is None:
+		args = sys.argv
+
+	desc='''%prog is used to simulate the monitoring interfaces used by satprep (Nagios/Icinga CGIs, MK Livestatus and the Icinga2 REST API) with a synthetic host landscape. It can be used to test the satprep toolkit offline, e.g.: ./satprep_prepare_maintenance.py -b livestatus -u localhost:6557 -K -f errata-snapshot.csv. Stop the server using CTRL+C to print request statistics.
+
+Checkout the GitHub page for updates: https://github.com/stdevel/satprep'''
+	parser = OptionParser(description=desc, version="%prog version 0.3.6")
+	#define option groups
+	genOpts = OptionGroup(parser, "Generic Options")
+	srvOpts = OptionGroup(parser, "Server Options")
+	parser.add_option_group(genOpts)
+	parser.add_option_group(srvOpts)
+
+	#GENERIC OPTIONS
+	#-d / --debug
+	genOpts.add_option("-d", "--debug", dest="debug", default=False, action="store_true", help="enable debugging outputs (default: no)")
+
+	#SERVER OPTIONS
+	#-l / --listen
+	srvOpts.add_option("-l", "--listen", dest="address", metavar="ADDRESS", default="127.0.0.1", help="defines the address to listen on (default: 127.0.0.1)")
+	#-p / --port
+	srvOpts.add_option("-p", "--port", dest="port", action="store", type="int", metavar="PORT", default=8081, help="defines the port to serve the CGIs and Icinga2 API on (default: 8081)")
+	#-s / --livestatus-port
+	srvOpts.add_option("-s", "--livestatus-port", dest="livestatusPort", action="store", type="int", metavar="PORT", default=6557, help="defines the port to serve Livestatus on, 0 disables it (default: 6557)")
+	#-S / --livestatus-socket
+	srvOpts.add_option("-S", "--livestatus-socket", dest="livestatusSocket", action="store", metavar="FILE", default="", help="additionally serves Livestatus on a unix socket")
+	#-n / --hosts
+	srvOpts.add_option("-n", "--hosts", dest="hosts", action="store", type="int", metavar="NUMBER", default=100, help="defines how many hosts are simulated, names match satprep_fake_satellite.py (default: 100)")
+	#-L / --latency
+	srvOpts.add_option("-L", "--latency", dest="latency", action="store", type="int", metavar="MSEC", default=0, help="adds a delay to every request to simulate network round trips (default: 0)")
+	#-D / --downtime
+	srvOpts.add_option("-D", "--downtime", dest="downtimes", action="append", metavar="HOST", default=[], help="defines hosts that are already scheduled for downtime")
+
+	(options, args) = parser.parse_args(args)
+	return (options, args)
+
+
+
+if __name__ == "__main__":
+	(options, args) = parse_options()
+
+	if options.debug:
+		logging.basicConfig(level=logging.DEBUG)
+		LOGGER.setLevel(logging.DEBUG)
+	else:
+		logging.basicConfig()
+		LOGGER.setLevel(logging.INFO)
+
+	main(options)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# satprep_fake_satellite.py - a script for simulating the
+# Spacewalk, Red Hat Satellite or SUSE Manager XMLRPC API
+# to test the satprep toolkit offline.
+#
+# 2015 By Christian Stankowic
+# <info at stankowic hyphen development dot net>
+# https://github.com/stdevel
+#
+
+import logging
+import SimpleXMLRPCServer
+import SocketServer
+import sys
+import threading
+import time
+import xmlrpclib
+from optparse import OptionParser, OptionGroup
+
+
+
+#set logger
+LOGGER = logging.getLogger('satprep_fake_satellite')
+
+
+
+class FakeRequestHandler(SimpleXMLRPCServer.SimpleXMLRPCRequestHandler):
+	rpc_paths = ("/rpc/api",)
+
+
+
+class FakeServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer.SimpleXMLRPCServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+
+
+class FakeSatellite(object):
+	#generates a synthetic system landscape and answers API calls
+	def __init__(self, systems, latency=0.0, sessionTimeout=0):
+		self.latency = latency
+		self.sessionTimeout = sessionTimeout
+		self.sessions = {}
+		self.calls = {}
+		self.lock = threading.Lock()
+		self.systems = []
+		for i in range(systems):
+			self.systems.append({
+				"id": 1000000000 + i,
+				"name": "host{0:04d}.localdomain".format(i),
+				"last_checkin": xmlrpclib.DateTime("20150101T00:00:00"),
+				"last_boot": 1420070400
+			})
+
+	def _dispatch(self, method, params):
+		#count calls and simulate network latency
+		with self.lock:
+			self.calls[method] = self.calls.get(method, 0) + 1
+		if self.latency:
+			time.sleep(self.latency)
+		func = getattr(self, method.replace(".", "_"), None)
+		if func is None or method.startswith("_"):
+			raise xmlrpclib.Fault(-1, "Could not find method {0}".format(method))
+		if method not in ["auth.login", "api.getVersion"]:
+			self._check_session(params[0])
+		return func(*params)
+
+	def _check_session(self, key):
+		#simulate expiring sessions
+		with self.lock:
+			if key not in self.sessions or (self.sessionTimeout and time.time() - self.sessions[key] > self.sessionTimeout):
+				raise xmlrpclib.Fault(-1, "Could not find session with id {0}".format(key))
+
+	def _system(self, sid):
+		for system in self.systems:
+			if system["id"] == sid: return system
+		raise xmlrpclib.Fault(-210, "No such system - sid = {0}".format(sid))
+
+	def _errata(self, sid):
+		errata = []
+		for i in range(sid % 5):
+			if i == 0: synopsis = "Important: kernel security update"
+			else: synopsis = "Moderate: package{0} bug fix update".format(i)
+			errata.append({
+				"id": i,
+				"advisory_name": "RHSA-2015:{0:04d}".format(i),
+				"advisory_type": ["Security Advisory", "Bug Fix Advisory", "Product Enhancement Advisory"][i % 3],
+				"advisory_synopsis": synopsis,
+				"update_date": "1/{0}/15".format(i+1)
+			})
+		return errata
+
+	#AUTH / API
+	def auth_login(self, username, password):
+		with self.lock:
+			key = "fakekey{0}".format(len(self.sessions))
+			self.sessions[key] = time.time()
+		return key
+
+	def auth_logout(self, key):
+		with self.lock:
+			self.sessions.pop(key, None)
+		return 1
+
+	def api_getVersion(self):
+		return "17"
+
+	#SYSTEM
+	def system_listSystems(self, key):
+		return self.systems
+
+	def system_getId(self, key, name):
+		return [system for system in self.systems if system["name"] == name]
+
+	def system_getDetails(self, key, sid):
+		system = self._system(sid)
+		details = {"id": sid, "profile_name": system["name"], "lock_status": False}
+		if sid % 2: details["virtualization"] = "Fully Virtualized"
+		return details
+
+	def system_getNetwork(self, key, sid):
+		system = self._system(sid)
+		return {"ip": "10.{0}.{1}.{2}".format(sid % 7, (sid / 250) % 250, sid % 250), "hostname": system["name"]}
+
+	def system_getCustomValues(self, key, sid):
+		system = self._system(sid)
+		values = {"SYSTEM_OWNER": "Tux  Penguin", "SYSTEM_PROD": str(sid % 2), "SYSTEM_MONITORING": "1"}
+		if sid % 2:
+			values["SYSTEM_VIRT_SNAPSHOT"] = "1"
+			values["SYSTEM_VIRT_VMNAME"] = system["name"].split(".")[0]
+		return values
+
+	def system_setCustomValues(self, key, sid, values):
+		self._system(sid)
+		return 1
+
+	def system_getRelevantErrata(self, key, sid):
+		self._system(sid)
+		return self._errata(sid)
+
+	def system_listLatestUpgradablePackages(self, key, sid):
+		self._system(sid)
+		return [{"name": "package{0}".format(i), "to_package_id": (sid % 100000) * 10 + i, "from_version": "1.0", "from_release": "1", "to_version": "1.1", "to_release": "1"} for i in range(sid % 3)]
+
+	def system_getSubscribedBaseChannel(self, key, sid):
+		self._system(sid)
+		return {"id": 1, "label": "rhel-x86_64-server-6"}
+
+	def system_listSubscribedChildChannels(self, key, sid):
+		self._system(sid)
+		return [{"id": 2, "label": "rhn-tools-rhel-x86_64-server-6"}]
+
+	def system_listSubscribableChildChannels(self, key, sid):
+		self._system(sid)
+		return [{"id": 3, "label": "rhel-x86_64-server-optional-6"}]
+
+	def system_setBaseChannel(self, key, sid, label):
+		return 1
+
+	def system_setChildChannels(self, key, sid, labels):
+		return 1
+
+	#SYSTEM GROUPS
+	def systemgroup_listAllGroups(self, key):
+		return [{"id": 1, "name": "all"}]
+
+	def systemgroup_listSystems(self, key, group):
+		if group != "all": raise xmlrpclib.Fault(-208, "No such group")
+		return [{"id": system["id"], "profile_name": system["name"]} for system in self.systems]
+
+	#ERRATA / PACKAGES / CHANNELS
+	def errata_listKeywords(self, key, advisory):
+		if int(advisory[-4:]) % 2: return ["reboot_suggested"]
+		return []
+
+	def packages_listProvidingErrata(self, key, pid):
+		if pid % 2: return [{"advisory": "RHBA-2015:{0:04d}".format(pid % 10000)}]
+		return []
+
+	def channel_software_clone(self, key, label, details, originalState):
+		return 1
+
+	def channel_software_delete(self, key, label):
+		return 1
+
+
+
+def main(options):
+	satellite = FakeSatellite(options.systems, options.latency/1000.0, options.sessionTimeout)
+	server = FakeServer((options.address, options.port), requestHandler=FakeRequestHandler, logRequests=options.debug, allow_none=True)
+	server.register_instance(satellite)
+	if options.multicall:
+		server.register_multicall_functions()
+	LOGGER.info("Simulating {0} systems on http://{1}:{2}/rpc/api".format(options.systems, options.address, options.port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		#print statistics
+		for method in sorted(satellite.calls):
+			LOGGER.info("{0}: {1} calls".format(method, satellite.calls[method]))
+
+
+
+def parse_options(args=None):
+	if args is None:
+		args = sys.argv
+
+	desc='''%prog is used to simulate the XMLRPC API of Spacewalk, Red Hat Satellite and SUSE Manager with a synthetic system landscape. It can be used to test the satprep toolkit offline, e.g.: ./satprep_snapshot.py -s localhost:8080. Stop the server using CTRL+C to print call statistics.
+
+Checkout the GitHub page for updates: https://github.com/stdevel/satprep'''
+	parser = OptionParser(description=desc, version="%prog version 0.3.6")
+	#define option groups
+	genOpts = OptionGroup(parser, "Generic Options")
+	srvOpts = OptionGroup(parser, "Server Options")
+	parser.add_option_group(genOpts)
+	parser.add_option_group(srvOpts)
+
+	#GENERIC OPTIONS
+	#-d / --debug
+	genOpts.add_option("-d", "--debug", dest="debug", default=False, action="store_true", help="enable debugging outputs (default: no)")
+
+	#SERVER OPTIONS
+	#-l / --listen
+	srvOpts.add_option("-l", "--listen", dest="address", metavar="ADDRESS", default="127.0.0.1", help="defines the address to listen on (default: 127.0.0.1)")
+	#-p / --port
+	srvOpts.add_option("-p", "--port", dest="port", action="store", type="int", metavar="PORT", default=8080, help="defines the port to listen on (default: 8080)")
+	#-n / --systems
+	srvOpts.add_option("-n", "--systems", dest="systems", action="store", type="int", metavar="NUMBER", default=100, help="defines how many systems are simulated (default: 100)")
+	#-L / --latency
+	srvOpts.add_option("-L", "--latency", dest="latency", action="store", type="int", metavar="MSEC", default=0, help="adds a delay to every API call to simulate network round trips (default: 0)")
+	#-t / --session-timeout
+	srvOpts.add_option("-t", "--session-timeout", dest="sessionTimeout", action="store", type="int", metavar="SECONDS", default=0, help="invalidates sessions after SECONDS to simulate expiring sessions (default: 0, never)")
+	#-M / --no-multicall
+	srvOpts.add_option("-M", "--no-multicall", dest="multicall", action="store_false", default=True, help="disables system.multicall to test the fallback to single calls (default: no)")
+
+	(options, args) = parser.parse_args(args)
+	return (options, args)
+
+
+
+if __name__ == "__main__":
+	(options, args) = parse_options()
+
+	if options.debug:
+		logging.basicConfig(level=logging.DEBUG)
+		LOGGER.setLevel(logging.DEBUG)
+	else:
+		logging.basicConfig()
+		LOGGER.setLevel(logging.INFO)
+
+	main(options)
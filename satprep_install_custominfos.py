@@ -13,9 +13,8 @@
 import logging
 import pprint
 import sys
-import xmlrpclib
 from optparse import OptionParser, OptionGroup
-from satprep_shared import check_if_api_is_supported, get_credentials
+from satprep_shared import check_if_api_is_supported, get_credentials, SatelliteSession
 
 
 
@@ -55,7 +54,7 @@ def main(options):
         (username, password) = get_credentials("Satellite", options.authfile)
 
         satellite_url = "http://{0}/rpc/api".format(options.server)
-        client = xmlrpclib.Server(satellite_url, verbose=options.debug)
+        client = SatelliteSession(satellite_url, username, password, verbose=options.debug)
         key = client.auth.login(username, password)
 
         check_if_api_is_supported(client)
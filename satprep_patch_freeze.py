@@ -14,7 +14,7 @@ import pprint
 import sys
 import xmlrpclib
 from optparse import OptionParser, OptionGroup
-from satprep_shared import check_if_api_is_supported, get_credentials, is_blacklisted
+from satprep_shared import check_if_api_is_supported, get_credentials, is_blacklisted, ConcurrentClient, SatelliteSession
 import datetime
 
 
@@ -26,18 +26,20 @@ myChannels={}
 
 
 
-def getChannels(client, key):
+def getChannels(batcher, key):
 	#get _all_ the hosts
 	satGroups=[]
 	global myChannels
 	global mySystems
+	client = batcher.client
 	
 	for item in client.systemgroup.listAllGroups(key):
 		satGroups.append(item["name"])
 	LOGGER.debug("This Satellite server's groups: '{0}'".format(satGroups))
 	tempHosts=[]
+	hostIds = dict(zip(options.targetSystems, batcher.call_many("system.getId", [(key, host) for host in options.targetSystems])))
 	for host in options.targetSystems:
-		if len(client.system.getId(key, host)) != 0: tempHosts.append(host)
+		if len(hostIds[host]) != 0: tempHosts.append(host)
 		else: LOGGER.error("System '{0}' appears not to be a valid host".format(host))
 	for group in options.targetGroups:
 		if group in satGroups:
@@ -47,11 +49,15 @@ def getChannels(client, key):
 				LOGGER.debug("Adding system '{0}'".format(host["profile_name"]))
 		else: LOGGER.error("Group '{0}' appears not to be a valid group".format(group))
 	#removing blacklisted or hosts without base channel
+	validHosts=[]
 	for host in tempHosts:
-		hostId = client.system.getId(key, host)
 		if is_blacklisted(host, options.exclude):
 			LOGGER.debug("System '{0}' is blacklisted".format(host))
-		elif len(client.system.getSubscribedBaseChannel(key, hostId[0]["id"])) < 1:
+		else: validHosts.append(host)
+	hostIds = dict(zip(validHosts, batcher.call_many("system.getId", [(key, host) for host in validHosts])))
+	baseChannels = dict(zip(validHosts, batcher.call_many("system.getSubscribedBaseChannel", [(key, hostIds[host][0]["id"]) for host in validHosts])))
+	for host in validHosts:
+		if len(baseChannels[host]) < 1:
 			LOGGER.error("System '{0}' has no base channel".format(host))
 		else:
 			LOGGER.debug("Adding valid system '{0}'".format(host))	
@@ -67,10 +73,10 @@ def getChannels(client, key):
 	for host in mySystems:
 		#adding base-channel
 		LOGGER.debug("Check base-channel for system '{0}'".format(host))
-		hostId = client.system.getId(key, host)
+		hostId = hostIds[host]
 		try:
 			LOGGER.debug("This system's profile ID: {0}".format(hostId))
-			baseChannel = client.system.getSubscribedBaseChannel(key, hostId[0]["id"])
+			baseChannel = baseChannels[host]
 			cleanBase = baseChannel["label"]
 			if "." in cleanBase: cleanBase = cleanBase[cleanBase.find(".")+1:]
 			if cleanBase not in myChannels:
@@ -162,14 +168,16 @@ def cloneChannels(client, key, date, label, unfreeze=False):
 
 
 
-def remapSystems(client, key, unfreeze=False):
+def remapSystems(batcher, key, unfreeze=False):
 	#remap systems
+	client = batcher.client
 	if options.noRemap: LOGGER.info("Not remapping system's channels")
 	else:
-		for system in mySystems:
+		#get _all_ the system IDs and base-channels at once
+		hostIds = batcher.call_many("system.getId", [(key, system) for system in mySystems])
+		baseChannels = batcher.call_many("system.getSubscribedBaseChannel", [(key, hostId[0]["id"]) for hostId in hostIds])
+		for system, hostId, myBase in zip(mySystems, hostIds, baseChannels):
 			#remap base-channel
-			hostId = client.system.getId(key, system)
-			myBase = client.system.getSubscribedBaseChannel(key, hostId[0]["id"])
 			if options.unfreeze:
 				myNewBase = myBase["label"]
 				myNewBase = myNewBase[myNewBase.find(".")+1:]
@@ -234,18 +242,21 @@ def main(options):
 	#authenticate against Satellite and check whether supported API found
         (username, password) = get_credentials("Satellite", options.authfile)
         satellite_url = "http://{0}/rpc/api".format(options.server)
-        client = xmlrpclib.Server(satellite_url, verbose=options.debug)
+        client = SatelliteSession(satellite_url, username, password, verbose=options.debug)
         key = client.auth.login(username, password)
         check_if_api_is_supported(client)
 	
 	#get channels
-	getChannels(client, key)
+	batcher = ConcurrentClient(client, options.concurrency, options.batchSize)
+	getChannels(batcher, key)
 	if options.unfreeze:
-		remapSystems(client, key, True)
+		remapSystems(batcher, key, True)
 		cloneChannels(client, key, options.targetDate, options.targetLabel, True)
 	else:
 		cloneChannels(client, key, options.targetDate, options.targetLabel)
-		remapSystems(client, key)
+		remapSystems(batcher, key)
+	batcher.close()
+	client.close()
 
 
 
@@ -287,6 +298,10 @@ If you're not defining variables or an authfile you will be prompted to enter yo
 	srvOpts.add_option("-a", "--authfile", dest="authfile", metavar="FILE", default="", help="defines an auth file to use instead of shell variables")
 	#-s / --server
 	srvOpts.add_option("-s", "--server", dest="server", metavar="SERVER", default="localhost", help="defines the server to use (default: localhost)")
+	#-b / --batch-size
+	srvOpts.add_option("-b", "--batch-size", action="store", type="int", default=0, dest="batchSize", metavar="SIZE", help="bundles up to SIZE independent API calls into one system.multicall request, falls back to single calls if not supported by the server (default: 0, disabled)")
+	#-C / --concurrency
+	srvOpts.add_option("-C", "--concurrency", action="store", type="int", default=1, dest="concurrency", metavar="NUMBER", help="sends up to NUMBER independent API calls (or system.multicall requests) at once using keep-alive connections (default: 1)")
 	
 	#SYSTEM OPTIONS
 	#-S / --system
@@ -14,9 +14,11 @@ import logging
 import sys
 from optparse import OptionParser, OptionGroup
 import csv
-from satprep_shared import schedule_downtime, get_credentials, create_snapshot, is_downtime, has_snapshot, schedule_downtime_hostgroup, is_blacklisted
+from satprep_shared import schedule_downtime, get_credentials, create_snapshot, is_downtime, DowntimeIndex, has_snapshot, schedule_downtime_hostgroup, is_blacklisted, is_compact_snapshot, read_compact_snapshot, configure_monitoring_sessions, close_monitoring_sessions, RateLimiter, get_monitoring_backend, MONITORING_BACKENDS, close_libvirt_connections
 import time
 import os
+import Queue
+import threading
 
 
 
@@ -62,7 +64,8 @@ def verify():
 	#check downtimes
 	if len(downtimeHosts) == 0 or options.skipMonitoring: LOGGER.info("No downtimes to verify.")
 	else:
-		#check _all_ the downtimes
+		#check _all_ the downtimes, status pages are only requested once per monitoring server
+		downtimes = DowntimeIndex(options.userAgent, options.noAuth, options.monitoringBackend)
 		for host in downtimeHosts:
 			#try to get differing host/credentials
 			if "@" in host and ":" in host:
@@ -78,11 +81,11 @@ def verify():
 			if thisURI != "" and thisCred != "":
 				#get username and password
 				(thisUsername, thisPassword) = get_credentials(thisURI, thisCred)
-				result = is_downtime(thisURI, thisUsername, thisPassword, thisHost, options.userAgent, options.noAuth)
+				result = is_downtime(thisURI, thisUsername, thisPassword, thisHost, options.userAgent, options.noAuth, downtimes)
 			else:
 				#get default login if not in cache
 				if defaultMonUser == "": (defaultMonUser, defaultMonPass) = get_credentials("Monitoring", options.monAuthfile)
-				result = is_downtime(options.URL, defaultMonUser, defaultMonPass, thisHost, options.userAgent, options.noAuth)
+				result = is_downtime(options.URL, defaultMonUser, defaultMonPass, thisHost, options.userAgent, options.noAuth, downtimes)
 			
 			if result:
 				#host in downtime
@@ -166,10 +169,11 @@ def setDowntimes():
 				LOGGER.info("Scheduling downtime for hostgroup '" + thisHostgroup + "'...")
 				#get default login if not specified
 				if defaultMonUser == "": (defaultMonUser, defaultMonPass) = get_credentials("Monitoring", options.monAuthfile)
-				result = schedule_downtime_hostgroup(options.URL, defaultMonUser, defaultMonPass, thisHostgroup, options.hours, options.comment, options.userAgent, options.noAuth)
+				result = schedule_downtime_hostgroup(options.URL, defaultMonUser, defaultMonPass, thisHostgroup, options.hours, options.comment, options.userAgent, options.noAuth, options.monitoringBackend)
 		return True
 	
 	#set downtime for affected hosts
+	tasks = []
 	for host in downtimeHosts:
 		#try to get differing host/credentials
 		if "@" in host and ":" in host:
@@ -202,17 +206,73 @@ def setDowntimes():
 			#add differing host information
 			if thisURI != "": output = output + "' (using " + thisURI + " - " + thisCred + ")..."
 			else: output = output + "'..."
-			LOGGER.info(output)
 			
-			#(un)schedule downtime
+			#credentials are requested before scheduling as they might be prompted
 			if thisURI != "" and thisCred != "":
 				#get username and password
 				(thisUsername, thisPassword) = get_credentials(thisURI, thisCred)
-				result = schedule_downtime(thisURI, thisUsername, thisPassword, thisHost, options.hours, options.comment, options.userAgent, options.noAuth, options.tidy)
+				tasks.append((output, thisURI, thisUsername, thisPassword, thisHost))
 			else:
 				#get default login if not in cache
 				if defaultMonUser == "": (defaultMonUser, defaultMonPass) = get_credentials("Monitoring", options.monAuthfile)
-				result = schedule_downtime(options.URL, defaultMonUser, defaultMonPass, thisHost, options.hours, options.comment, options.userAgent, options.noAuth, options.tidy)
+				tasks.append((output, options.URL, defaultMonUser, defaultMonPass, thisHost))
+	
+	#(un)schedule downtimes
+	if len(tasks) > 0: scheduleDowntimes(tasks)
+
+
+
+def scheduleDowntimes(tasks):
+	#(un)schedule downtimes using multiple threads, jobs and rate limit apply per monitoring server
+	start = time.time()
+	queues = {}
+	for task in tasks:
+		if task[1] not in queues: queues[task[1]] = Queue.Queue()
+		queues[task[1]].put(task)
+	failed = []
+	def work(queue, limiter):
+		while True:
+			try:
+				(output, url, username, password, host) = queue.get_nowait()
+			except Queue.Empty:
+				return
+			limiter.wait()
+			LOGGER.info(output)
+			try:
+				result = schedule_downtime(url, username, password, host, options.hours, options.comment, options.userAgent, options.noAuth, options.tidy, options.monitoringBackend)
+			except Exception, e:
+				LOGGER.error("Unable to (un)schedule downtime for host '" + host + "': " + str(e))
+				result = False
+			if not result: failed.append(host)
+	def work_bulk(queue, limiter):
+		#bulk backends (un)schedule the downtimes of all hosts sharing the same credentials with one request
+		hosts = {}
+		while not queue.empty():
+			(output, url, username, password, host) = queue.get_nowait()
+			LOGGER.info(output)
+			hosts.setdefault((url, username, password), []).append(host)
+		for (url, username, password) in hosts:
+			limiter.wait()
+			try:
+				backend = get_monitoring_backend(url, username, password, options.userAgent, options.noAuth, options.monitoringBackend)
+				failed.extend(backend.schedule_downtimes(hosts[(url, username, password)], options.hours, options.comment, options.tidy))
+			except Exception, e:
+				LOGGER.error("Unable to (un)schedule downtimes on '" + url + "': " + str(e))
+				failed.extend(hosts[(url, username, password)])
+	workers = []
+	for url in queues:
+		limiter = RateLimiter(options.rateLimit)
+		if MONITORING_BACKENDS[options.monitoringBackend].bulk:
+			workers.append(threading.Thread(target=work_bulk, args=(queues[url], limiter)))
+		else:
+			workers.extend([threading.Thread(target=work, args=(queues[url], limiter)) for i in range(min(options.jobs, queues[url].qsize()))])
+	for worker in workers:
+		worker.start()
+	for worker in workers:
+		worker.join()
+	LOGGER.info("(Un)scheduled {0} of {1} downtimes on {2} monitoring servers in {3:.1f} seconds".format(len(tasks)-len(failed), len(tasks), len(queues), time.time()-start))
+	if len(failed) > 0: LOGGER.error("Unable to (un)schedule downtimes for hosts: " + ", ".join(sorted(failed)))
+	return failed
 
 
 
@@ -283,9 +343,12 @@ def readFile(file):
 	myPrefix = time.strftime("%Y%m%d", time.gmtime(os.path.getmtime(args[1])))
 	
 	#read report header and get column index for hostname ,reboot and monitoring flag (if any)
-	rFile = open(args[1], 'r')
-	header = rFile.readline()
-	headers = header.replace("\n","").replace("\r","").split(";")
+	if is_compact_snapshot(args[1]):
+		headers = read_compact_snapshot(open(args[1], 'rb')).next()
+	else:
+		rFile = open(args[1], 'r')
+		header = rFile.readline()
+		headers = header.replace("\n","").replace("\r","").split(";")
 	repcols = { "hostname" : 666, "errata_reboot" : 666, "system_prod": 666, "system_monitoring" : 666, "system_monitoring_name" : 666, "system_virt" : 666, "system_virt_snapshot" : 666, "system_virt_vmname" : 666 }
 	for name,value in repcols.items():
 		try:
@@ -298,7 +361,11 @@ def readFile(file):
 	
 	#read report and add affected hosts
 	with open(file, 'rb') as csvfile:
-		filereader = csv.reader(csvfile, delimiter=';', quotechar='|')
+		if is_compact_snapshot(file):
+			#compact reports are expanded to CSV rows
+			filereader = read_compact_snapshot(csvfile)
+		else:
+			filereader = csv.reader(csvfile, delimiter=';', quotechar='|')
 		for row in filereader:
 			if options.noIntelligence == True:
 				#simply add the damned host
@@ -377,17 +444,23 @@ def main(options):
 	#read file
 	readFile(args[1])
 	
-	if options.verifyOnly == True:
-		#verify only
-		verify()
-	else:
-		#create snapshots and schedule downtimes
-		if options.skipSnapshot == False: createSnapshots()
-		if options.skipMonitoring == False: setDowntimes()
-		#also verify
-		if options.dryrun == False:
-			LOGGER.info("Verifying preparation...")
+	#monitoring sessions and libvirt connections are re-used by all requests
+	configure_monitoring_sessions(max(options.httpPoolSize, options.jobs), options.httpTimeout, options.httpRetries)
+	try:
+		if options.verifyOnly == True:
+			#verify only
 			verify()
+		else:
+			#create snapshots and schedule downtimes
+			if options.skipSnapshot == False: createSnapshots()
+			if options.skipMonitoring == False: setDowntimes()
+			#also verify
+			if options.dryrun == False:
+				LOGGER.info("Verifying preparation...")
+				verify()
+	finally:
+		close_monitoring_sessions()
+		close_libvirt_connections()
 
 
 
@@ -447,6 +520,8 @@ def parse_options(args=None):
 	monOpts.add_option("-a", "--mon-authfile", dest="monAuthfile", metavar="FILE", default="", help="defines an auth file to use for monitoring")
 	#-u / --monitoring-url
 	monOpts.add_option("-u", "--monitoring-url", dest="URL", metavar="URL", default="http://localhost/icinga", help="defines the default Nagios/Icinga/Thruk/Shinken URL to use, might be overwritten by custom system keys (default: http://localhost/icinga)")
+	#-b / --monitoring-backend
+	monOpts.add_option("-b", "--monitoring-backend", action="store", type="choice", dest="monitoringBackend", default="cgi", metavar="[cgi|livestatus|icinga2]", choices=["cgi","livestatus","icinga2"], help="defines how the monitoring is accessed: cgi (Nagios/Icinga/Thruk/Shinken CGIs), livestatus (monitoring URL is a Livestatus socket path or host:port) or icinga2 (Icinga2 REST API, e.g. https://localhost:5665); livestatus and icinga2 (un)schedule downtimes of all hosts with one request (default: cgi)")
 	#-t / --hours
 	monOpts.add_option("-t", "--hours", action="store", dest="hours", default="4", metavar="HOURS", help="sets the time period in hours hosts should be scheduled for downtime (default: 4)")
 	#-x / --no-auth
@@ -455,6 +530,16 @@ def parse_options(args=None):
 	monOpts.add_option("-A", "--user-agent", action="store", default="", metavar="AGENT", dest="userAgent", help="sets a custom HTTP user agent")
 	#-g / --downtime-hostgroup
 	monOpts.add_option("-g", "--downtime-hostgroup", action="append", type="string", default=[], metavar="HOSTGROUP", dest="downtimeHostgroups", help="defines hostgroups which should be scheduled for downtime. NOTE: This disables scheduling downtime for particular hosts.")
+	#-P / --http-pool-size
+	monOpts.add_option("-P", "--http-pool-size", action="store", type="int", default=10, metavar="NUMBER", dest="httpPoolSize", help="defines how many keep-alive connections are kept per monitoring server (default: 10)")
+	#-w / --http-timeout
+	monOpts.add_option("-w", "--http-timeout", action="store", type="int", default=30, metavar="SECONDS", dest="httpTimeout", help="defines the timeout for monitoring requests (default: 30)")
+	#-j / --jobs
+	monOpts.add_option("-j", "--jobs", action="store", type="int", default=1, metavar="NUMBER", dest="jobs", help="defines how many downtimes are (un)scheduled in parallel per monitoring server (default: 1)")
+	#-R / --rate-limit
+	monOpts.add_option("-R", "--rate-limit", action="store", type="float", default=0, metavar="NUMBER", dest="rateLimit", help="defines how many downtimes are (un)scheduled per second and monitoring server at most (default: 0, unlimited)")
+	#-r / --http-retries
+	monOpts.add_option("-r", "--http-retries", action="store", type="int", default=3, metavar="NUMBER", dest="httpRetries", help="defines how often failed connections to monitoring servers are retried (default: 3)")
 	
 	#VM OPTIONS
 	#-K / --skip-snapshot
@@ -466,6 +551,11 @@ def parse_options(args=None):
 	
 	(options, args) = parser.parse_args(args)
 	
+	if options.jobs < 1:
+		parser.error("number of jobs needs to be 1 or higher")
+	if options.rateLimit < 0:
+		parser.error("rate limit needs to be 0 (unlimited) or higher")
+	
 	#check whether snapshot reported
 	if len(args) != 2:
 		print "ERROR: you need to specify exactly one snapshot report!"
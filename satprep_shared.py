@@ -2,25 +2,43 @@
 # -*- coding: utf-8 -*-
 
 import getpass
+import gzip
+import json
 import logging
 import os
+import Queue
+import re
+import socket
 import stat
 import sys
 import requests
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 import time
 from datetime import datetime, timedelta
 import libvirt
 from fnmatch import fnmatch
 import string
+import threading
+import urllib
+import xmlrpclib
 
 
 
 #some global variables
-LIBVIRT_USERNAME=""
-LIBVIRT_PASSWORD=""
-
 LOGGER =  logging.getLogger('satprep-shared')
+#libvirt connections per hypervisor, see get_libvirt_connection()
+LIBVIRT_CONNECTIONS = {}
+LIBVIRT_CONNECTIONS_LOCK = threading.Lock()
+#HTTP sessions per monitoring server, see get_monitoring_session()
+MONITORING_SESSIONS = {}
+MONITORING_SESSIONS_LOCK = threading.Lock()
+MONITORING_SESSION_OPTIONS = {"poolSize": 10, "timeout": 30, "retries": 3}
+#Livestatus and Icinga2 API objects of hosts, see MonitoringBackend
+LIVESTATUS_HEADER = "OutputFormat: json\nResponseHeader: fixed16\n\n"
+ICINGA2_HOST_FILTER = "host.name in hosts"
+#host links on monitoring status pages (Nagios, Icinga, Thruk)
+DOWNTIME_HOST_LINK = re.compile(r"extinfo\.cgi\?type=1&(?:amp;)?host=([^'\"&<>\s]+)")
 SUPPORTED_API_LEVELS = ["11.1", "12", "13", "13.0", "14", "14.0", "15", "15.0", "16", "16.0", "17", "17.0"]
 
 
@@ -43,6 +61,229 @@ def check_if_api_is_supported(client):
 
 
 
+def is_session_fault(fault):
+#check whether an API fault was caused by an invalid or expired session
+	return "session" in fault.faultString.lower()
+
+
+
+def is_method_fault(fault):
+#check whether an API fault was caused by an unknown method, e.g. a missing system.multicall
+	message = fault.faultString.lower()
+	return fault.faultCode == -32601 or "could not find method" in message or "is not supported" in message
+
+
+
+class _SessionMethod(object):
+	#API method proxy, supports nested names like system.getDetails
+	def __init__(self, session, name):
+		self.session = session
+		self.name = name
+
+	def __getattr__(self, name):
+		return _SessionMethod(self.session, self.name + "." + name)
+
+	def __call__(self, *args):
+		return self.session.call(self.name, args)
+
+
+
+class SatelliteSession(object):
+	#XMLRPC client that re-authenticates and retries calls if the session expired
+	def __init__(self, url, username, password, verbose=False, retries=1):
+		self.url = url
+		self.verbose = verbose
+		#every thread uses its own keep-alive connection
+		self.connections = threading.local()
+		self.username = username
+		self.password = password
+		self.retries = retries
+		self.key = None
+		#session keys handed out before, replaced by the current key
+		self.staleKeys = set()
+		self.lock = threading.Lock()
+
+	def __getattr__(self, name):
+		return _SessionMethod(self, name)
+
+	@property
+	def client(self):
+		if not hasattr(self.connections, "client"):
+			self.connections.client = xmlrpclib.Server(self.url, verbose=self.verbose)
+		return self.connections.client
+
+	def close(self):
+		#close the keep-alive connection of the calling thread
+		if hasattr(self.connections, "client"):
+			self.connections.client("close")()
+			del self.connections.client
+
+	def login(self):
+		with self.lock:
+			if self.key is None:
+				self.key = self.client.auth.login(self.username, self.password)
+			return self.key
+
+	def relogin(self, failedKey):
+		with self.lock:
+			#another thread might have renewed the session already
+			if self.key == failedKey:
+				LOGGER.info("Session expired, logging in again...")
+				self.staleKeys.add(self.key)
+				self.key = self.client.auth.login(self.username, self.password)
+			return self.key
+
+	def logout(self):
+		with self.lock:
+			if self.key is not None:
+				try:
+					self.client.auth.logout(self.key)
+				except xmlrpclib.Fault, e:
+					#nothing to do if the session already expired
+					if not is_session_fault(e): raise
+				self.staleKeys.add(self.key)
+				self.key = None
+
+	def _renew_key(self, value):
+		#replace stale session keys in call arguments
+		if isinstance(value, basestring) and value in self.staleKeys:
+			return self.key
+		return value
+
+	def call(self, method, args):
+		if method == "auth.login":
+			return self.login()
+		elif method == "auth.logout":
+			return self.logout()
+
+		attempt = 0
+		while True:
+			key = self.key
+			args = tuple([self._renew_key(arg) for arg in args])
+			if method == "system.multicall":
+				#also renew keys of bundled calls
+				for entry in args[0]:
+					entry["params"] = [self._renew_key(arg) for arg in entry["params"]]
+			try:
+				result = getattr(self.client, method)(*args)
+				if method == "system.multicall":
+					#session faults are reported per bundled call
+					for entry in result:
+						if isinstance(entry, dict) and is_session_fault(xmlrpclib.Fault(entry["faultCode"], entry["faultString"])):
+							raise xmlrpclib.Fault(entry["faultCode"], entry["faultString"])
+				return result
+			except xmlrpclib.Fault, e:
+				if not is_session_fault(e) or attempt >= self.retries or key is None:
+					raise
+				attempt = attempt + 1
+				self.relogin(key)
+
+
+
+class MultiCallClient(object):
+	#bundles independent (read) API calls into system.multicall requests
+	def __init__(self, client, batchSize=50):
+		self.client = client
+		self.batchSize = batchSize
+		#disabled for batch sizes below 2 or if the server lacks multicall
+		self.supported = (batchSize > 1)
+
+	def call_many(self, method, argsList):
+		#call method once per argument tuple, results are kept in order
+		results = []
+		while self.supported and len(results) < len(argsList):
+			batchArgs = argsList[len(results):len(results)+self.batchSize]
+			batch = xmlrpclib.MultiCall(self.client)
+			for args in batchArgs:
+				getattr(batch, method)(*args)
+			try:
+				response = batch()
+			except (xmlrpclib.Fault, xmlrpclib.ProtocolError), e:
+				#other faults (e.g. permissions or expired sessions) don't disable bundling
+				if isinstance(e, xmlrpclib.Fault) and not is_method_fault(e): raise
+				LOGGER.info("system.multicall not supported by server ({0}), using single calls".format(e))
+				self.supported = False
+				break
+			LOGGER.debug("Bundled {0} '{1}' calls".format(len(batchArgs), method))
+			#failing calls raise their xmlrpclib.Fault here
+			results.extend(response)
+
+		#single calls as fallback
+		func = getattr(self.client, method)
+		for args in argsList[len(results):]:
+			results.append(func(*args))
+		return results
+
+
+
+class ConcurrentClient(MultiCallClient):
+	#sends independent (read) API calls in parallel, optionally bundled
+	def __init__(self, client, concurrency=4, batchSize=0):
+		MultiCallClient.__init__(self, client, batchSize)
+		self.concurrency = concurrency
+		#long-lived workers limit the requests in flight and re-use their keep-alive connections
+		self.tasks = Queue.Queue()
+		self.workers = []
+
+	def _start_workers(self, count):
+		while len(self.workers) < min(self.concurrency, count):
+			worker = threading.Thread(target=self._work)
+			worker.daemon = True
+			worker.start()
+			self.workers.append(worker)
+
+	def _work(self):
+		#worker thread, sends chunks until close() is called
+		while True:
+			task = self.tasks.get()
+			if task is None: break
+			(method, argsList, index, done, failed) = task
+			if failed.is_set():
+				#skip remaining chunks of a failed call
+				done.put((index, None, None))
+				continue
+			try:
+				done.put((index, MultiCallClient.call_many(self, method, argsList), None))
+			except Exception:
+				failed.set()
+				done.put((index, None, sys.exc_info()))
+		if isinstance(self.client, SatelliteSession):
+			self.client.close()
+
+	def call_many(self, method, argsList):
+		#call method once per argument tuple, results are kept in order
+		chunkSize = max(self.batchSize, 1)
+		chunks = [argsList[i:i+chunkSize] for i in range(0, len(argsList), chunkSize)]
+		if self.concurrency < 2 or len(chunks) < 2:
+			return MultiCallClient.call_many(self, method, argsList)
+
+		self._start_workers(len(chunks))
+		done = Queue.Queue()
+		failed = threading.Event()
+		for index, chunk in enumerate(chunks):
+			self.tasks.put((method, chunk, index, done, failed))
+		results = [None] * len(chunks)
+		errors = []
+		for chunk in chunks:
+			(index, result, error) = done.get()
+			results[index] = result
+			if error is not None: errors.append(error)
+		if len(errors) > 0:
+			#re-raise the first error, e.g. a xmlrpclib.Fault
+			raise errors[0][0], errors[0][1], errors[0][2]
+		LOGGER.debug("Sent {0} '{1}' calls using {2} connections".format(len(argsList), method, len(self.workers)))
+		return [result for chunk in results for result in chunk]
+
+	def close(self):
+		#stop workers, they close their connections
+		for worker in self.workers:
+			self.tasks.put(None)
+		for worker in self.workers:
+			worker.join()
+		self.workers = []
+
+
+
 def get_credentials(type, input_file=None):
 #retrieve credentials
     if input_file:
@@ -81,16 +322,8 @@ def get_credentials(type, input_file=None):
 
 def has_snapshot(virtURI, hostUsername, hostPassword, vmName, name):
 #check whether VM has a snapshot
-	#authentificate
-	global LIBVIRT_USERNAME
-	global LIBVIRT_PASSWORD
-	LIBVIRT_USERNAME = hostUsername
-	LIBVIRT_PASSWORD = hostPassword
-	
 	LOGGER.debug("Checking for snapshots with user '" + hostUsername + "'...")
-	auth = [[libvirt.VIR_CRED_AUTHNAME, libvirt.VIR_CRED_PASSPHRASE], get_libvirt_credentials, None]
-	
-	conn = libvirt.openAuth(virtURI, auth, 0)
+	conn = get_libvirt_connection(virtURI, hostUsername, hostPassword)
 	
 	if conn == None:
 		LOGGER.error("Unable to establish connection to hypervisor!")
@@ -104,19 +337,73 @@ def has_snapshot(virtURI, hostUsername, hostPassword, vmName, name):
 
 
 
-def is_downtime(url, monUsername, monPassword, host, agent, noAuth=False):
-#check whether host is scheduled for downtime
-	#setup headers
-	if len(agent) > 0: myHeaders = {'User-Agent': agent}
-	else: myHeaders = {'User-Agent': 'satprep Toolkit (https://github.com/stdevel/satprep)'}
-	LOGGER.debug("Setting headers: {0}".format(myHeaders))
-	
-	#setup HTTP session
-	s = requests.Session()
-	if noAuth == False: s.auth = HTTPBasicAuth(monUsername, monPassword)
+class RateLimiter(object):
+	#spaces calls of all threads to at most rate calls per second, 0 disables the limit
+	def __init__(self, rate=0):
+		if rate > 0: self.interval = 1.0 / rate
+		else: self.interval = 0
+		self.next = 0
+		self.lock = threading.Lock()
 	
+	def wait(self):
+		if self.interval == 0: return
+		with self.lock:
+			now = time.time()
+			slot = max(now, self.next)
+			self.next = slot + self.interval
+		if slot > now: time.sleep(slot - now)
+
+
+
+def configure_monitoring_sessions(poolSize=10, timeout=30, retries=3):
+#set connection pool size, timeout (seconds) and connection retries of monitoring sessions
+	MONITORING_SESSION_OPTIONS["poolSize"] = poolSize
+	MONITORING_SESSION_OPTIONS["timeout"] = timeout
+	MONITORING_SESSION_OPTIONS["retries"] = retries
+
+
+
+def get_monitoring_session(url, monUsername, monPassword, agent="", noAuth=False):
+#get a keep-alive HTTP session for a monitoring server, sessions are shared by all calls
+	key = (url, monUsername, monPassword, agent, noAuth)
+	with MONITORING_SESSIONS_LOCK:
+		if key not in MONITORING_SESSIONS:
+			#setup headers
+			if len(agent) > 0: myHeaders = {'User-Agent': agent}
+			else: myHeaders = {'User-Agent': 'satprep Toolkit (https://github.com/stdevel/satprep)'}
+			LOGGER.debug("Setting headers: {0}".format(myHeaders))
+			
+			#setup HTTP session, only failed connections are retried as commands must not be sent twice
+			s = requests.Session()
+			if noAuth == False: s.auth = HTTPBasicAuth(monUsername, monPassword)
+			s.headers.update(myHeaders)
+			s.verify = False
+			adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MONITORING_SESSION_OPTIONS["poolSize"], max_retries=MONITORING_SESSION_OPTIONS["retries"])
+			s.mount("http://", adapter)
+			s.mount("https://", adapter)
+			MONITORING_SESSIONS[key] = s
+		return MONITORING_SESSIONS[key]
+
+
+
+def close_monitoring_sessions():
+#close all monitoring sessions and their connections
+	with MONITORING_SESSIONS_LOCK:
+		for s in MONITORING_SESSIONS.values():
+			s.close()
+		MONITORING_SESSIONS.clear()
+
+
+
+def get_downtime_hosts(url, monUsername, monPassword, agent="", noAuth=False):
+#get hosts scheduled for downtime from the monitoring status page
 	#send GET request
-	r = s.get(url+"/cgi-bin/status.cgi?host=all&hostprops=1&style=hostdetail", headers=myHeaders, verify=False)
+	s = get_monitoring_session(url, monUsername, monPassword, agent, noAuth)
+	try:
+		r = s.get(url+"/cgi-bin/status.cgi?host=all&hostprops=1&style=hostdetail", timeout=MONITORING_SESSION_OPTIONS["timeout"])
+	except requests.exceptions.RequestException, e:
+		LOGGER.error("Unable to check downtimes on '" + url + "': " + str(e))
+		return None
 	try:
 		LOGGER.debug("Result: {0}".format(r.text))
 	except:
@@ -124,26 +411,67 @@ def is_downtime(url, monUsername, monPassword, host, agent, noAuth=False):
 	
 	#check whether request was successful
 	if r.status_code != 200:
-		LOGGER.error("Got HTTP status code " + str(r.status_code) + " instead of 200 while checking downtime for host '" + host + "'. Check URL and logon credentials!")
-		return False
-	else:
-		if "error" in r.text.lower(): LOGGER.error("Unable to get downtime for host '" + host + "' - please run again with -d / --debug and check HTML output! (does this host exist?!)")
+		LOGGER.error("Got HTTP status code " + str(r.status_code) + " instead of 200 while checking downtimes on '" + url + "'. Check URL and logon credentials!")
+		return None
+	if "error" in r.text.lower():
+		LOGGER.error("Unable to get downtimes from '" + url + "' - please run again with -d / --debug and check HTML output!")
+		return None
+	
+	#hosts are linked to their extended information page
+	hosts = set()
+	for name in DOWNTIME_HOST_LINK.findall(r.text):
+		hosts.add(urllib.unquote_plus(name).lower())
+	LOGGER.debug("Hosts in downtime on '" + url + "': {0}".format(sorted(hosts)))
+	if len(hosts) == 0:
+		#unknown page layout or no downtimes, search the page like before
+		return r.text.lower()
+	return hosts
+
+
+
+class DowntimeIndex(object):
+	#hosts in downtime per monitoring server, every status page is requested only once
+	def __init__(self, agent="", noAuth=False, backend="cgi"):
+		self.agent = agent
+		self.noAuth = noAuth
+		self.backend = backend
+		self.hosts = {}
+		self.lock = threading.Lock()
+	
+	def get_hosts(self, url, monUsername, monPassword):
+		#returns a set of host names or the status page, None if the status is unavailable
+		key = (url, monUsername, monPassword)
+		with self.lock:
+			if key not in self.hosts:
+				self.hosts[key] = get_monitoring_backend(url, monUsername, monPassword, self.agent, self.noAuth, self.backend).get_downtime_hosts()
+			return self.hosts[key]
+	
+	def is_downtime(self, url, monUsername, monPassword, host):
+		hosts = self.get_hosts(url, monUsername, monPassword)
+		if hosts is None:
+			LOGGER.error("Unable to get downtime for host '" + host + "' - please run again with -d / --debug and check HTML output! (does this host exist?!)")
+			return False
+		elif host.lower() not in hosts:
+			LOGGER.info("Host '" + host + "' currently NOT scheduled for downtime.")
+			return False
 		else:
-			if host.lower() not in r.text.lower():
-				LOGGER.info("Host '" + host + "' currently NOT scheduled for downtime.")
-				return False
-			else:
-				LOGGER.info("Host '" + host + "' currently in scheduled downtime.")
-				return True
+			LOGGER.info("Host '" + host + "' currently in scheduled downtime.")
+			return True
+
 
 
+def is_downtime(url, monUsername, monPassword, host, agent, noAuth=False, index=None, backend="cgi"):
+#check whether host is scheduled for downtime, use an index when checking multiple hosts
+	if index is None: index = DowntimeIndex(agent, noAuth, backend)
+	return index.is_downtime(url, monUsername, monPassword, host)
 
-def schedule_downtime(url, monUsername, monPassword, host, hours, comment, agent="", noAuth=False, unschedule=False):
+
+
+def schedule_downtime(url, monUsername, monPassword, host, hours, comment, agent="", noAuth=False, unschedule=False, backend="cgi"):
 #(un)schedule downtime
-	#setup headers
-	if len(agent) > 0: myHeaders = {'User-Agent': agent}
-	else: myHeaders = {'User-Agent': 'satprep Toolkit (https://github.com/stdevel/satprep)'}
-	LOGGER.debug("Setting headers: {0}".format(myHeaders))
+	if backend != "cgi":
+		failed = get_monitoring_backend(url, monUsername, monPassword, agent, noAuth, backend).schedule_downtimes([host], hours, comment, unschedule)
+		return len(failed) == 0
 	
 	#setup start and end time for downtime
 	current_time=time.strftime("%Y-%m-%d %H:%M:%S")
@@ -158,12 +486,13 @@ def schedule_downtime(url, monUsername, monPassword, host, hours, comment, agent
 		payload = {'cmd_typ': '55', 'cmd_mod': '2', 'host': host, 'com_data': comment, 'trigger': '0', 'fixed': '1', 'hours': hours, 'minutes': '0', 'start_time': current_time, 'end_time': end_time, 'btnSubmit': 'Commit', 'com_author': monUsername, 'childoptions': '0'}
 	LOGGER.debug("payload: {0}".format(payload))
 	
-	#setup HTTP session
-	s = requests.Session()
-	if noAuth == False: s.auth = HTTPBasicAuth(monUsername, monPassword)
-	
 	#send POST request
-	r = s.post(url+"/cgi-bin/cmd.cgi", data=payload, headers=myHeaders, verify=False)
+	s = get_monitoring_session(url, monUsername, monPassword, agent, noAuth)
+	try:
+		r = s.post(url+"/cgi-bin/cmd.cgi", data=payload, timeout=MONITORING_SESSION_OPTIONS["timeout"])
+	except requests.exceptions.RequestException, e:
+		LOGGER.error("Unable to (un)schedule downtime for host '" + host + "': " + str(e))
+		return False
 	try:
 		LOGGER.debug("Result: {0}".format(r.text))
 	except:
@@ -174,7 +503,9 @@ def schedule_downtime(url, monUsername, monPassword, host, hours, comment, agent
 		LOGGER.error("Got HTTP status code " + str(r.status_code) + " instead of 200 while (un)scheduling downtime for host '" + host + "'. Check URL and logon credentials!")
 		return False
 	else:
-		if "error" in r.text.lower(): LOGGER.error("Unable to (un)schedule downtime for host '" + host + "' - please run again with -d / --debug and check HTML output! (does this host exist?!)")
+		if "error" in r.text.lower():
+			LOGGER.error("Unable to (un)schedule downtime for host '" + host + "' - please run again with -d / --debug and check HTML output! (does this host exist?!)")
+			return False
 		else:
 			if unschedule: print "Successfully unscheduled downtime for host '" + host + "'"
 			else: print "Successfully scheduled downtime for host '" + host + "'"
@@ -182,12 +513,10 @@ def schedule_downtime(url, monUsername, monPassword, host, hours, comment, agent
 
 
 
-def schedule_downtime_hostgroup(url, monUsername, monPassword, hostgroup, hours, comment, agent="", noAuth=False):
+def schedule_downtime_hostgroup(url, monUsername, monPassword, hostgroup, hours, comment, agent="", noAuth=False, backend="cgi"):
 #schedule downtime for hostgroup
-	#setup headers
-	if len(agent) > 0: myHeaders = {'User-Agent': agent}
-	else: myHeaders = {'User-Agent': 'satprep Toolkit (https://github.com/stdevel/satprep)'}
-	LOGGER.debug("Setting headers: {0}".format(myHeaders))
+	if backend != "cgi":
+		return get_monitoring_backend(url, monUsername, monPassword, agent, noAuth, backend).schedule_downtime_hostgroup(hostgroup, hours, comment)
 	
 	#setup start and end time for downtime
 	current_time=time.strftime("%Y-%m-%d %H:%M:%S")
@@ -200,12 +529,13 @@ def schedule_downtime_hostgroup(url, monUsername, monPassword, hostgroup, hours,
 	payload = {'cmd_typ': '85', 'cmd_mod': '2', 'hostgroup': hostgroup, 'com_data': comment, 'trigger': '0', 'fixed': '1', 'hours': hours, 'minutes': '0', 'start_time': current_time, 'end_time': end_time, 'btnSubmit': 'Commit', 'com_author': monUsername, 'childoptions': '0', 'ahas': 'on'}
 	LOGGER.debug("payload: {0}".format(payload))
 
-	#setup HTTP session
-	s = requests.Session()
-	if noAuth == False: s.auth = HTTPBasicAuth(monUsername, monPassword)
-
 	#send POST request
-	r = s.post(url+"/cgi-bin/cmd.cgi", data=payload, headers=myHeaders, verify=False)
+	s = get_monitoring_session(url, monUsername, monPassword, agent, noAuth)
+	try:
+		r = s.post(url+"/cgi-bin/cmd.cgi", data=payload, timeout=MONITORING_SESSION_OPTIONS["timeout"])
+	except requests.exceptions.RequestException, e:
+		LOGGER.error("Unable to schedule downtime for hostgroup '" + hostgroup + "': " + str(e))
+		return False
 	try:
 		LOGGER.debug("Result: {0}".format(r.text))
 	except:
@@ -223,16 +553,243 @@ def schedule_downtime_hostgroup(url, monUsername, monPassword, hostgroup, hours,
 
 
 
+
+class MonitoringBackend(object):
+	#interface to the monitoring system, bulk backends (un)schedule downtimes of many hosts with one request
+	bulk = False
+	
+	def __init__(self, url, monUsername, monPassword, agent="", noAuth=False):
+		self.url = url
+		self.monUsername = monUsername
+		self.monPassword = monPassword
+		self.agent = agent
+		self.noAuth = noAuth
+	
+	def get_author(self):
+		if self.monUsername != "": return self.monUsername
+		return "satprep"
+	
+	def get_downtime_hosts(self):
+		#returns a set of host names in downtime, None if the status is unavailable
+		raise NotImplementedError
+	
+	def schedule_downtimes(self, hosts, hours, comment, unschedule=False):
+		#(un)schedules downtimes and returns the hosts that failed
+		raise NotImplementedError
+	
+	def schedule_downtime_hostgroup(self, hostgroup, hours, comment):
+		#schedules downtime for all hosts and services of a hostgroup
+		raise NotImplementedError
+
+
+
+class CGIBackend(MonitoringBackend):
+	#Nagios/Icinga/Thruk/Shinken CGIs, one request per host
+	def get_downtime_hosts(self):
+		return get_downtime_hosts(self.url, self.monUsername, self.monPassword, self.agent, self.noAuth)
+	
+	def schedule_downtimes(self, hosts, hours, comment, unschedule=False):
+		failed = []
+		for host in hosts:
+			if not schedule_downtime(self.url, self.monUsername, self.monPassword, host, hours, comment, self.agent, self.noAuth, unschedule): failed.append(host)
+		return failed
+	
+	def schedule_downtime_hostgroup(self, hostgroup, hours, comment):
+		return schedule_downtime_hostgroup(self.url, self.monUsername, self.monPassword, hostgroup, hours, comment, self.agent, self.noAuth)
+
+
+
+class LivestatusBackend(MonitoringBackend):
+	#MK Livestatus, the URL is a socket path or host:port (optionally prefixed with unix: or tcp:)
+	bulk = True
+	
+	def get_address(self):
+		url = self.url
+		if url.startswith("unix:"): return (socket.AF_UNIX, url[5:])
+		if url.startswith("tcp:"): url = url[4:]
+		elif url.startswith("/") or ":" not in url: return (socket.AF_UNIX, url)
+		return (socket.AF_INET, (url[:url.rfind(":")], int(url[url.rfind(":")+1:])))
+	
+	def send(self, request):
+		#send a request and return the answer, Livestatus closes the connection afterwards
+		(family, address) = self.get_address()
+		LOGGER.debug("Livestatus request to '" + self.url + "': {0}".format(request))
+		s = socket.socket(family, socket.SOCK_STREAM)
+		s.settimeout(MONITORING_SESSION_OPTIONS["timeout"])
+		try:
+			s.connect(address)
+			s.sendall(request)
+			s.shutdown(socket.SHUT_WR)
+			data = []
+			while True:
+				chunk = s.recv(65536)
+				if not chunk: break
+				data.append(chunk)
+		finally:
+			s.close()
+		LOGGER.debug("Result: {0}".format("".join(data)))
+		return "".join(data)
+	
+	def query(self, table, filters=[], conjunction=""):
+		#get the names of all objects of a table matching the filters
+		request = "GET " + table + "\nColumns: name\n" + "".join(["Filter: " + f + "\n" for f in filters])
+		if conjunction != "" and len(filters) > 1: request = request + conjunction + ": " + str(len(filters)) + "\n"
+		answer = self.send(request + LIVESTATUS_HEADER)
+		if len(answer) < 16 or not answer[:3].isdigit():
+			raise ValueError("invalid Livestatus answer '" + answer[:16] + "'")
+		if answer[:3] != "200":
+			raise ValueError("Livestatus error " + answer[:3] + ": " + answer[16:].strip())
+		return [row[0] for row in json.loads(answer[16:])]
+	
+	def command(self, commands):
+		#send external commands, all commands share one connection
+		now = int(time.time())
+		self.send("".join(["COMMAND [" + str(now) + "] " + c.replace("\n", " ") + "\n\n" for c in commands]))
+	
+	def get_downtime_command(self, type, name, hours, comment):
+		start = int(time.time())
+		return "SCHEDULE_{0}_DOWNTIME;{1};{2};{3};1;0;{4};{5};{6}".format(type, name, start, start+int(hours)*3600, int(hours)*3600, self.get_author(), comment)
+	
+	def get_downtime_hosts(self):
+		try:
+			hosts = self.query("hosts", ["scheduled_downtime_depth > 0"])
+		except (socket.error, ValueError), e:
+			LOGGER.error("Unable to check downtimes on '" + self.url + "': " + str(e))
+			return None
+		return set([host.lower() for host in hosts])
+	
+	def schedule_downtimes(self, hosts, hours, comment, unschedule=False):
+		try:
+			#Livestatus doesn't answer commands, so unknown hosts are detected beforehand
+			known = set(self.query("hosts", ["name = " + host for host in hosts], "Or"))
+			commands = []
+			for host in hosts:
+				if host not in known: continue
+				if unschedule: commands.append("DEL_DOWNTIME_BY_HOST_NAME;" + host)
+				else: commands.append(self.get_downtime_command("HOST", host, hours, comment))
+			if len(commands) > 0: self.command(commands)
+		except (socket.error, ValueError), e:
+			LOGGER.error("Unable to (un)schedule downtimes on '" + self.url + "': " + str(e))
+			return list(hosts)
+		failed = []
+		for host in hosts:
+			if host not in known:
+				LOGGER.error("Unable to (un)schedule downtime for host '" + host + "' - host not found on '" + self.url + "'")
+				failed.append(host)
+			elif unschedule: print "Successfully unscheduled downtime for host '" + host + "'"
+			else: print "Successfully scheduled downtime for host '" + host + "'"
+		return failed
+	
+	def schedule_downtime_hostgroup(self, hostgroup, hours, comment):
+		try:
+			if len(self.query("hostgroups", ["name = " + hostgroup])) == 0:
+				LOGGER.error("Unable to schedule downtime for hostgroup '" + hostgroup + "' - hostgroup not found on '" + self.url + "'")
+				return False
+			self.command([self.get_downtime_command("HOSTGROUP_HOST", hostgroup, hours, comment), self.get_downtime_command("HOSTGROUP_SVC", hostgroup, hours, comment)])
+		except (socket.error, ValueError), e:
+			LOGGER.error("Unable to schedule downtime for hostgroup '" + hostgroup + "': " + str(e))
+			return False
+		print "Successfully scheduled downtime for hostgroup '" + hostgroup + "'"
+		return True
+
+
+
+class Icinga2Backend(MonitoringBackend):
+	#Icinga2 REST API, the URL points to the API listener (e.g. https://localhost:5665)
+	bulk = True
+	
+	def request(self, path, data, method="POST"):
+		#send a JSON request, filtered queries are sent as POST requests overriding the method
+		s = get_monitoring_session(self.url, self.monUsername, self.monPassword, self.agent, self.noAuth)
+		LOGGER.debug("Icinga2 request to '" + self.url + "/v1/" + path + "': {0}".format(data))
+		r = s.post(self.url+"/v1/"+path, data=json.dumps(data), headers={"Accept": "application/json", "Content-Type": "application/json", "X-HTTP-Method-Override": method}, timeout=MONITORING_SESSION_OPTIONS["timeout"])
+		LOGGER.debug("Result: {0}".format(r.text))
+		#404 means that no objects matched the filter
+		if r.status_code == 404: return []
+		if r.status_code not in [200, 500]:
+			raise ValueError("Got HTTP status code " + str(r.status_code) + " instead of 200. Check URL and logon credentials!")
+		result = json.loads(r.text)
+		#errors of the whole request (e.g. invalid filters) aren't reported per object
+		if "results" not in result:
+			raise ValueError("Got HTTP status code " + str(r.status_code) + ": " + str(result.get("status", r.text)))
+		return result["results"]
+	
+	def get_downtime_data(self, hours, comment):
+		start = int(time.time())
+		return {"type": "Host", "start_time": start, "end_time": start+int(hours)*3600, "fixed": True, "duration": int(hours)*3600, "author": self.get_author(), "comment": comment}
+	
+	def get_downtime_hosts(self):
+		try:
+			results = self.request("objects/hosts", {"attrs": ["name"], "filter": "host.downtime_depth > 0"}, "GET")
+		except (requests.exceptions.RequestException, ValueError), e:
+			LOGGER.error("Unable to check downtimes on '" + self.url + "': " + str(e))
+			return None
+		return set([result["name"].lower() for result in results])
+	
+	def schedule_downtimes(self, hosts, hours, comment, unschedule=False):
+		try:
+			if unschedule:
+				#removing downtimes reports hosts without downtime as successful, so unknown hosts are detected beforehand
+				known = set([result["name"] for result in self.request("objects/hosts", {"attrs": ["name"], "filter": ICINGA2_HOST_FILTER, "filter_vars": {"hosts": hosts}}, "GET")])
+				if len(known) > 0:
+					results = self.request("actions/remove-downtime", {"type": "Host", "filter": ICINGA2_HOST_FILTER, "filter_vars": {"hosts": sorted(known)}})
+					for result in results:
+						if int(result["code"]) != 200: raise ValueError(result["status"])
+			else:
+				data = self.get_downtime_data(hours, comment)
+				data["filter"] = ICINGA2_HOST_FILTER
+				data["filter_vars"] = {"hosts": hosts}
+				#downtimes are named host!downtime
+				known = set([result["name"].split("!")[0] for result in self.request("actions/schedule-downtime", data) if int(result["code"]) == 200])
+		except (requests.exceptions.RequestException, ValueError, KeyError), e:
+			LOGGER.error("Unable to (un)schedule downtimes on '" + self.url + "': " + str(e))
+			return list(hosts)
+		failed = []
+		for host in hosts:
+			if host not in known:
+				LOGGER.error("Unable to (un)schedule downtime for host '" + host + "' - host not found on '" + self.url + "'")
+				failed.append(host)
+			elif unschedule: print "Successfully unscheduled downtime for host '" + host + "'"
+			else: print "Successfully scheduled downtime for host '" + host + "'"
+		return failed
+	
+	def schedule_downtime_hostgroup(self, hostgroup, hours, comment):
+		data = self.get_downtime_data(hours, comment)
+		data["filter"] = "hostgroup in host.groups"
+		data["filter_vars"] = {"hostgroup": hostgroup}
+		data["all_services"] = True
+		try:
+			results = self.request("actions/schedule-downtime", data)
+		except (requests.exceptions.RequestException, ValueError), e:
+			LOGGER.error("Unable to schedule downtime for hostgroup '" + hostgroup + "': " + str(e))
+			return False
+		if len(results) == 0:
+			LOGGER.error("Unable to schedule downtime for hostgroup '" + hostgroup + "' - hostgroup not found on '" + self.url + "'")
+			return False
+		print "Successfully scheduled downtime for hostgroup '" + hostgroup + "'"
+		return True
+
+
+
+MONITORING_BACKENDS = {"cgi": CGIBackend, "livestatus": LivestatusBackend, "icinga2": Icinga2Backend}
+
+
+
+def get_monitoring_backend(url, monUsername, monPassword, agent="", noAuth=False, backend="cgi"):
+#get the backend for a monitoring server, see MONITORING_BACKENDS
+	return MONITORING_BACKENDS[backend](url, monUsername, monPassword, agent, noAuth)
+
+
+
 def get_libvirt_credentials(credentials, user_data):
-#get credentials for libvirt
-	global LIBVIRT_USERNAME
-	global LIBVIRT_PASSWORD
+#get credentials for libvirt, user_data contains username and password of the connection
+	(hostUsername, hostPassword) = user_data
 	
 	for credential in credentials:
 		if credential[0] == libvirt.VIR_CRED_AUTHNAME:
 			# prompt the user to input a authname. display the provided message
 			#credential[4] = raw_input(credential[1] + ": ")
-			credential[4] = LIBVIRT_USERNAME
+			credential[4] = hostUsername
 			
 			# if the user just hits enter raw_input() returns an empty string.
 			# in this case return the default result through the last item of
@@ -244,25 +801,60 @@ def get_libvirt_credentials(credentials, user_data):
 			# display the provided message and return the result through the
 			# last item of the list
 			#credential[4] = getpass.getpass(credential[1] + ": ")
-			credential[4] = LIBVIRT_PASSWORD
+			credential[4] = hostPassword
 		else:
 			return -1
 	return 0
 
 
 
+def get_libvirt_connection(virtURI, hostUsername, hostPassword):
+#get a connection to a hypervisor, connections are shared by all calls
+	key = (virtURI, hostUsername, hostPassword)
+	with LIBVIRT_CONNECTIONS_LOCK:
+		if key in LIBVIRT_CONNECTIONS:
+			try:
+				#re-connect if the hypervisor closed the connection
+				if LIBVIRT_CONNECTIONS[key].isAlive() == 1: return LIBVIRT_CONNECTIONS[key]
+				LOGGER.debug("Connection to '" + virtURI + "' was closed, re-connecting...")
+			except AttributeError:
+				#libvirt < 0.9.8
+				return LIBVIRT_CONNECTIONS[key]
+			except libvirt.libvirtError, e:
+				LOGGER.debug("Connection to '" + virtURI + "' is broken, re-connecting: " + str(e))
+			close_libvirt_connection(LIBVIRT_CONNECTIONS.pop(key))
+		
+		#authentificate, credentials are handed to the callback per connection
+		LOGGER.debug("Connecting to '" + virtURI + "' with user '" + hostUsername + "'...")
+		auth = [[libvirt.VIR_CRED_AUTHNAME, libvirt.VIR_CRED_PASSPHRASE], get_libvirt_credentials, (hostUsername, hostPassword)]
+		conn = libvirt.openAuth(virtURI, auth, 0)
+		if conn != None: LIBVIRT_CONNECTIONS[key] = conn
+		return conn
+
+
+
+def close_libvirt_connection(conn):
+#close a libvirt connection, errors are ignored as the connection might be gone already
+	try:
+		conn.close()
+	except libvirt.libvirtError, e:
+		LOGGER.debug("Unable to close libvirt connection: " + str(e))
+
+
+
+def close_libvirt_connections():
+#close all libvirt connections
+	with LIBVIRT_CONNECTIONS_LOCK:
+		for conn in LIBVIRT_CONNECTIONS.values():
+			close_libvirt_connection(conn)
+		LIBVIRT_CONNECTIONS.clear()
+
+
+
 def create_snapshot(virtURI, hostUsername, hostPassword, vmName, name, comment, remove=False):
 #create/remove snapshot
-	#authentificate
-	global LIBVIRT_USERNAME
-	global LIBVIRT_PASSWORD
-	LIBVIRT_USERNAME = hostUsername
-	LIBVIRT_PASSWORD = hostPassword
-
 	LOGGER.debug("Creating snapshot with user '" + hostUsername + "'...")
-	auth = [[libvirt.VIR_CRED_AUTHNAME, libvirt.VIR_CRED_PASSPHRASE], get_libvirt_credentials, None]
-	
-	conn = libvirt.openAuth(virtURI, auth, 0)
+	conn = get_libvirt_connection(virtURI, hostUsername, hostPassword)
 	
 	if conn == None:
 		LOGGER.error("Unable to establish connection to hypervisor!")
@@ -308,3 +900,32 @@ def get_systems_by_systemgroup(client, key, group):
 def escape_string(str):
         temp=filter(string.printable.__contains__,str)
         return ''.join([c for c in temp if ord(c) > 31 or ord(c) == 9])
+
+
+
+def is_compact_snapshot(filename):
+#check whether a snapshot report uses the compact format (gzip compressed JSON lines)
+	return filename.endswith(".gz")
+
+
+
+def read_compact_snapshot(fileobj):
+#read rows of a compact snapshot report in CSV column order, the first row is the header
+	report = gzip.GzipFile(fileobj=fileobj, mode="rb")
+	try:
+		#first line contains the columns, host information is only stored once per host
+		header = json.loads(report.readline())
+		yield [str(field) for field in header["fields"]]
+		hostIndexes = [header["fields"].index(field) for field in header["host"]]
+		errataIndexes = [header["fields"].index(field) for field in header["errata"]]
+		for line in report:
+			record = json.loads(line)
+			for erratum in record["errata"]:
+				row = [""] * len(header["fields"])
+				for index, value in zip(hostIndexes, record["host"]):
+					row[index] = value.encode("utf-8")
+				for index, value in zip(errataIndexes, erratum):
+					row[index] = value.encode("utf-8")
+				yield row
+	finally:
+		report.close()
@@ -11,13 +11,19 @@
 #
 
 import csv
+import glob
+import gzip
+import json
 import logging
 import os
+import Queue
 import sys
+import threading
 import time
 import xmlrpclib
+from fnmatch import fnmatch
 from optparse import OptionParser, OptionGroup
-from satprep_shared import check_if_api_is_supported, get_credentials, escape_string
+from satprep_shared import check_if_api_is_supported, get_credentials, escape_string, is_blacklisted, is_compact_snapshot, read_compact_snapshot, ConcurrentClient, SatelliteSession
 from unidecode import unidecode
 
 
@@ -30,7 +36,11 @@ POSSIBLE_FIELDS = ["hostname", "ip", "errata_name", "errata_type",
 	 "system_backup", "system_backup_notes", "system_antivir", "system_antivir_notes"
  ]
 DEFAULT_FIELDS = POSSIBLE_FIELDS
+#compact reports store host columns once per host and errata columns per erratum
+ERRATA_FIELDS = [field for field in DEFAULT_FIELDS if field.startswith("errata_")]
+HOST_FIELDS = [field for field in DEFAULT_FIELDS if field not in ERRATA_FIELDS]
 LOGGER = logging.getLogger('satprep-snapshot')
+KEYWORD_CACHE = None
 
 
 
@@ -55,6 +65,8 @@ Checkout the GitHub page for updates: https://github.com/stdevel/satprep'''
 	parser.add_option_group(srvOpts)
 	snapOpts = OptionGroup(parser, "Snapshot Options")
 	parser.add_option_group(snapOpts)
+	sysOpts = OptionGroup(parser, "System Options")
+	parser.add_option_group(sysOpts)
 	
 	#GENERIC OPTIONS
 	#-q / --quiet
@@ -68,25 +80,74 @@ Checkout the GitHub page for updates: https://github.com/stdevel/satprep'''
 	#-s / --server
 	srvOpts.add_option("-s", "--server", dest="server", metavar="SERVER", default="localhost", help="defines the server to use (default: localhost)")
 	#-r / --reconnect-threshold
-	srvOpts.add_option("-r", "--reconnect-threshold", action="store", type="int", default=5, dest="reconnectThreshold", metavar="THRESHOLD", help="defines after how many host scans a re-login should be done (XMLRPC API timeout workaround, default: 5)")
+	srvOpts.add_option("-r", "--reconnect-threshold", action="store", type="int", default=5, dest="reconnectThreshold", metavar="THRESHOLD", help="deprecated and ignored, expired sessions are renewed automatically")
+	#-w / --workers
+	srvOpts.add_option("-w", "--workers", action="store", type="int", default=1, dest="workers", metavar="NUMBER", help="defines how many systems are scanned in parallel, each worker uses a dedicated XMLRPC session (default: 1)")
+	#-b / --batch-size
+	srvOpts.add_option("-b", "--batch-size", action="store", type="int", default=0, dest="batchSize", metavar="SIZE", help="bundles up to SIZE independent API calls into one system.multicall request, falls back to single calls if not supported by the server (default: 0, disabled)")
+	#-C / --concurrency
+	srvOpts.add_option("-C", "--concurrency", action="store", type="int", default=1, dest="concurrency", metavar="NUMBER", help="sends up to NUMBER independent API calls (or system.multicall requests) at once using keep-alive connections, applies per worker (default: 1)")
 	
 	#SNAPSHOT OPTIONS
 	#-o / --output
 	snapOpts.add_option("-o", "--output", action="store", type="string", dest="output", default="foobar", metavar="FILE", help=("define CSV report filename. (default: " "errata-snapshot-report-RHNhostname-Ymd.csv)"))
+	#-F / --format
+	snapOpts.add_option("-F", "--format", action="store", type="choice", dest="format", default="csv", metavar="[csv|compact]", choices=["csv", "compact"], help="defines the report format, compact reports are gzip compressed JSON lines storing host information only once per host (default: csv)")
+	#-i / --incremental
+	snapOpts.add_option("-i", "--incremental", action="store", type="string", default="", dest="incremental", metavar="FILE", help="only scans systems that checked in since the snapshot report FILE was created and copies all other systems from it (default: none). NOTE: errata published since then are only detected for re-scanned systems")
+	#-R / --resume
+	snapOpts.add_option("-R", "--resume", action="store_true", default=False, dest="resume", help="continues an interrupted snapshot, already scanned systems are skipped (default: no)")
 	#-f / --field
 	#snapOpts.add_option("-f", "--field", action="append", type="choice", dest="fields", choices=POSSIBLE_FIELDS, metavar="FIELDS", help="defines which fields should be integrated in the report (default: all available)")
 	#-p / --exclude-patches
 	snapOpts.add_option("-p", "--exclude-patches", action="store_true", default=False, dest="excludePatches", help="defines whether package updates that are not part of an erratum shall be excluded (default: no)")
 	#-l / --include-locked
 	snapOpts.add_option("-l", "--include-locked", action="store_true", default=False, dest="includeLocked", help="also includes locked systems (default: no)")
+	#-k / --keyword-cache
+	snapOpts.add_option("-k", "--keyword-cache", action="store", type="string", default="", dest="keywordCache", metavar="FILE", help="stores errata keywords (used for reboot detection) in FILE to re-use them in later runs (default: none)")
+	#-K / --keyword-cache-ttl
+	snapOpts.add_option("-K", "--keyword-cache-ttl", action="store", type="int", default=24, dest="keywordCacheTTL", metavar="HOURS", help="defines after how many hours cached errata keywords are fetched again (default: 24)")
+
+
+	#SYSTEM OPTIONS
+	#-S / --system
+	sysOpts.add_option("-S", "--system", action="append", dest="targetSystems", metavar="SYSTEM", type="string", default=[], help="only scans a particular system, wildcards are supported (default: all systems)")
+	#-g / --group
+	sysOpts.add_option("-g", "--group", action="append", dest="targetGroups", metavar="GROUP", type="string", default=[], help="only scans systems of a particular system group (default: all systems)")
+	#-e / --exclude
+	sysOpts.add_option("-e", "--exclude", action="append", dest="exclude", metavar="SYSTEM", type="string", default=[], help="defines hosts that should be excluded from the snapshot report")
 
 	(options, args) = parser.parse_args(args)
 
-	if options.output is 'foobar':
-		options.output = "errata-snapshot-report-{server}-{time}.csv".format(
+	if options.workers < 1:
+		parser.error("number of workers needs to be 1 or higher")
+	if options.concurrency < 1:
+		parser.error("concurrency needs to be 1 or higher")
+
+	if options.output is 'foobar' and options.resume:
+		#continue the latest interrupted snapshot of this server
+		checkpoints = sorted(glob.glob("errata-snapshot-report-{server}-*.checkpoint".format(
+			server=options.server
+		)))
+		if len(checkpoints) == 0:
+			parser.error("no interrupted snapshot report found, please specify it using -o / --output")
+		options.output = checkpoints[-1][:-len(".checkpoint")]
+	elif options.output is 'foobar':
+		options.output = "errata-snapshot-report-{server}-{time}.{suffix}".format(
 			server=options.server,
-			time=time.strftime("%Y%m%d-%H%M")
+			time=time.strftime("%Y%m%d-%H%M"),
+			suffix={"csv": "csv", "compact": "jsonl.gz"}[options.format]
 		)
+	elif options.format == "compact" and not is_compact_snapshot(options.output):
+		parser.error("compact snapshot report filenames need to end with .gz")
+
+	#split systems and groups
+	if len(options.targetSystems) == 1: options.targetSystems = str(options.targetSystems).strip("[]'").split(",")
+	if len(options.targetGroups) == 1: options.targetGroups = str(options.targetGroups).strip("[]'").split(",")
+	if len(options.exclude) == 1: options.exclude = str(options.exclude).strip("[]'").split(",")
+
+	if options.incremental and os.path.abspath(options.incremental) == os.path.abspath(options.output):
+		parser.error("previous snapshot report and output file need to be different")
 
 	LOGGER.debug("Options: {0}".format(options))
 	LOGGER.debug("Arguments: {0}".format(args))
@@ -96,41 +157,62 @@ Checkout the GitHub page for updates: https://github.com/stdevel/satprep'''
 
 
 def main(options):
+	global KEYWORD_CACHE
 	(username, password) = get_credentials("Satellite", options.authfile)
 
 	sattelite_url = "http://{0}/rpc/api".format(options.server)
-	client = xmlrpclib.Server(sattelite_url, verbose=options.debug)
+	client = SatelliteSession(sattelite_url, username, password, verbose=options.debug)
 	key = client.auth.login(username, password)
 	check_if_api_is_supported(client)
 	
 	if options.includeLocked: LOGGER.warning("Snapshot report will also include information about locked systems")
 
+	#errata keywords are shared by all systems (and workers)
+	KEYWORD_CACHE = KeywordCache(options.keywordCache, options.keywordCacheTTL*3600)
+
 	#check whether the output directory/file is writable
 	if os.access(os.path.dirname(options.output), os.W_OK) or os.access(os.getcwd(), os.W_OK):
 		LOGGER.debug("Output file/directory writable!")
 
 		#create CSV report, open file
 		csv.register_dialect("default", delimiter=";", quoting=csv.QUOTE_NONE)
-		writer = csv.writer(open(options.output, "w"), 'default')
-
-		#create header and scan _all_ the systems
-		writer.writerow(DEFAULT_FIELDS)
-		systems = client.system.listSystems(key)
-		#counter variable for XMLRPC timeout workaround (https://github.com/stdevel/satprep/issues/5)
-		hostCounter = 0
-		for system in systems:
-			process_system(client, key, writer, system)
-
-			#increase counter and re-login if necessary
-			if hostCounter == (options.reconnectThreshold-1):
-				#re-login
-				LOGGER.debug("Re-login due to XMLRPC timeout workaround!")
-				client.auth.logout(key)
-				key = client.auth.login(username, password)
-				hostCounter = 0
-			else:
-				#increase counter
-				hostCounter = hostCounter + 1
+		writer = SnapshotWriter(options.output, options.resume)
+
+		#scan _all_ the systems
+		systems = filter_systems(client, key, client.system.listSystems(key))
+		if options.resume:
+			LOGGER.info("Resuming snapshot report {0}, skipping {1} already scanned systems".format(options.output, len(writer.done)))
+			systems = [system for system in systems if system["id"] not in writer.done]
+		#rows of systems that didn't change since the previous snapshot
+		copied = {}
+		if options.incremental:
+			copied = get_unchanged_systems(options.incremental, systems)
+			LOGGER.info("Copying {0} unchanged systems from snapshot report {1}, scanning {2} systems".format(len(copied), options.incremental, len(systems)-len(copied)))
+		if options.workers > 1:
+			#workers are using their own sessions
+			LOGGER.info("Scanning {0} systems using {1} workers...".format(len(systems)-len(copied), options.workers))
+			savedCalls = process_systems_parallel(sattelite_url, username, password, writer, systems, copied)
+		else:
+			batcher = ConcurrentClient(client, options.concurrency, options.batchSize)
+			chunkSize = max(options.batchSize, 1) * options.concurrency
+			savedCalls = 0
+			scanSystems = [system for system in systems if system["id"] not in copied]
+			scanIndex = 0
+			for system in systems:
+				if system["id"] in copied:
+					writer.write_system(system, copied[system["id"]])
+					continue
+				if scanIndex % chunkSize == 0:
+					prefetched = prefetch_systems(batcher, key, scanSystems[scanIndex:scanIndex+chunkSize])
+				scanIndex = scanIndex + 1
+				collector = RowCollector()
+				savedCalls = savedCalls + process_system(batcher, key, collector, system, prefetched.get(system["id"]))
+				writer.write_system(system, collector.rows)
+			batcher.close()
+		LOGGER.info("Caching system information saved {0} XMLRPC calls".format(savedCalls))
+		LOGGER.info("Caching errata keywords saved {0} XMLRPC calls".format(KEYWORD_CACHE.saved))
+		KEYWORD_CACHE.save()
+		writer.close()
 
 	else:
 		#output file/directory not writable
@@ -138,29 +220,483 @@ def main(options):
 
 	#logout and exit
 	client.auth.logout(key)
+	client.close()
+
+
+
+def filter_systems(client, key, systems):
+	#select systems before any per-system calls are made
+	if len(options.targetGroups) > 0:
+		satGroups = [item["name"] for item in client.systemgroup.listAllGroups(key)]
+		groupIds = set()
+		for group in options.targetGroups:
+			if group in satGroups:
+				for host in client.systemgroup.listSystems(key, group):
+					groupIds.add(host["id"])
+			else: LOGGER.error("Group '{0}' appears not to be a valid group".format(group))
+	selected = []
+	for system in systems:
+		if len(options.targetSystems) > 0 or len(options.targetGroups) > 0:
+			if not any(fnmatch(system["name"].lower(), host.lower()) for host in options.targetSystems) and (len(options.targetGroups) == 0 or system["id"] not in groupIds):
+				continue
+		if is_blacklisted(system["name"], options.exclude):
+			LOGGER.debug("System '{0}' is blacklisted".format(system["name"]))
+			continue
+		selected.append(system)
+	if len(selected) != len(systems):
+		LOGGER.info("Selected {0} of {1} systems".format(len(selected), len(systems)))
+	return selected
 
 
 
-def process_system(client, key, writer, system):
-	LOGGER.debug("Found host {0[name]} (SID {0[id]})".format(system))
-	process_errata(client, key, writer, system)
+def get_system_state(system):
+	#information showing whether a system changed since the last snapshot
+	return (str(system.get("last_checkin", "")), str(system.get("last_boot", "")))
 
-	if options.excludePatches == False:
-		process_patches(client, key, writer, system)
 
 
+def get_unchanged_systems(filename, systems):
+	#get rows of unchanged systems from a previous snapshot report
+	copied = {}
+	if not os.path.exists(filename + ".index"):
+		LOGGER.warning("No index for snapshot report {0} found, scanning all systems".format(filename))
+		return copied
+
+	#read system states
+	states = {}
+	names = {}
+	with open(filename + ".index", "r") as index:
+		for line in index:
+			try:
+				(sid, lastCheckin, lastBoot, name) = line.rstrip("\r\n").split(";", 3)
+			except ValueError:
+				continue
+			states[int(sid)] = (lastCheckin, lastBoot)
+			names[name] = names.get(name, 0) + 1
+
+	#read rows by hostname
+	rows = {}
+	with open(filename, "rb") as report:
+		if is_compact_snapshot(filename):
+			reader = read_compact_snapshot(report)
+		else:
+			reader = csv.reader(report, 'default')
+		if reader.next() != DEFAULT_FIELDS:
+			LOGGER.warning("Snapshot report {0} has different columns, scanning all systems".format(filename))
+			return copied
+		for row in reader:
+			rows.setdefault(row[0], []).append(row)
+
+	for system in systems:
+		#hostnames need to be unique to assign rows
+		if states.get(system["id"]) == get_system_state(system) and names.get(system["name"]) == 1:
+			copied[system["id"]] = rows.get(system["name"], [])
+	return copied
+
+
+
+class SnapshotWriter(object):
+	#writes the report host by host and remembers completed systems
+	def __init__(self, filename, resume=False):
+		self.checkpointFile = filename + ".checkpoint"
+		self.indexFile = filename + ".index"
+		#every host is a separate gzip member, so compact reports can be truncated, too
+		self.compact = is_compact_snapshot(filename)
+		self.done = set()
+		self.complete = True
+		if resume and os.path.exists(self.checkpointFile) and os.path.exists(filename):
+			#drop rows written after the last checkpoint
+			self.report = open(filename, "r+b")
+			if self._read_fields() != DEFAULT_FIELDS:
+				LOGGER.critical("Report {0} has different columns, unable to resume".format(filename))
+				sys.exit(1)
+			offset = 0
+			with open(self.checkpointFile, "r") as checkpoint:
+				for line in checkpoint:
+					try:
+						(sid, sidOffset) = line.strip().split(";")
+						self.done.add(int(sid))
+						offset = int(sidOffset)
+					except ValueError:
+						#incomplete line
+						break
+			self.report.seek(offset)
+			self.report.truncate()
+			if offset == 0:
+				self._write_header()
+			self.checkpoint = open(self.checkpointFile, "a")
+			self.index = open(self.indexFile, "a")
+		else:
+			if resume:
+				LOGGER.warning("No checkpoint for report {0} found, creating new report".format(filename))
+			self.report = open(filename, "wb")
+			self.checkpoint = open(self.checkpointFile, "w")
+			#system states used for incremental snapshots
+			self.index = open(self.indexFile, "w")
+			self._write_header()
+		self.writer = csv.writer(self.report, 'default')
+
+	def _read_fields(self):
+		if self.compact:
+			return read_compact_snapshot(self.report).next()
+		return self.report.readline().rstrip("\r\n").split(";")
+
+	def _write_header(self):
+		if self.compact:
+			self._write_member([{"fields": DEFAULT_FIELDS, "host": HOST_FIELDS, "errata": ERRATA_FIELDS}])
+		else:
+			self.report.write(";".join(DEFAULT_FIELDS) + "\r\n")
+
+	def _write_member(self, records):
+		#write JSON lines as a complete gzip member
+		member = gzip.GzipFile(filename="", mode="wb", fileobj=self.report)
+		for record in records:
+			member.write(json.dumps(record, separators=(",", ":")) + "\n")
+		member.close()
+
+	def _write_compact(self, rows):
+		#group rows sharing the same host information
+		records = []
+		for row in rows:
+			host = [row[DEFAULT_FIELDS.index(field)] for field in HOST_FIELDS]
+			if len(records) == 0 or records[-1]["host"] != host:
+				records.append({"host": host, "errata": []})
+			records[-1]["errata"].append([row[DEFAULT_FIELDS.index(field)] for field in ERRATA_FIELDS])
+		if len(records) > 0:
+			self._write_member(records)
+
+	def write_system(self, system, rows):
+		#rows is None if scanning the system failed
+		if rows is None:
+			self.complete = False
+			return
+		if self.compact:
+			self._write_compact(rows)
+		else:
+			for row in rows:
+				self.writer.writerow(row)
+		self.report.flush()
+		self.checkpoint.write("{0};{1}\n".format(system["id"], self.report.tell()))
+		self.checkpoint.flush()
+		(lastCheckin, lastBoot) = get_system_state(system)
+		self.index.write("{0};{1};{2};{3}\n".format(system["id"], lastCheckin, lastBoot, system["name"]))
+		self.index.flush()
+
+	def close(self):
+		self.report.close()
+		self.checkpoint.close()
+		self.index.close()
+		#keep checkpoint if systems need to be scanned again
+		if self.complete:
+			os.remove(self.checkpointFile)
+		else:
+			LOGGER.warning("Some systems couldn't be scanned, use -R / --resume to retry them")
+
+
+
+class RowCollector(object):
+	#buffers CSV rows of a single system until they can be written in order
+	def __init__(self):
+		self.rows = []
+
+	def writerow(self, row):
+		self.rows.append(row)
+
+
+
+def process_systems_parallel(url, username, password, writer, systems, copied=None):
+	#scan systems using a pool of workers
+	if copied is None:
+		copied = {}
+	jobs = Queue.Queue()
+	results = Queue.Queue()
+	pending = {}
+	#workers are fetching chunks of systems to be able to bundle calls
+	chunkSize = max(options.batchSize, 1) * options.concurrency
+	chunk = []
+	for index, system in enumerate(systems):
+		if system["id"] in copied:
+			pending[index] = copied[system["id"]]
+			continue
+		chunk.append((index, system))
+		if len(chunk) == chunkSize:
+			jobs.put(chunk)
+			chunk = []
+	if chunk:
+		jobs.put(chunk)
+
+	workers = []
+	for i in range(min(options.workers, len(systems)-len(pending))):
+		worker = threading.Thread(target=process_worker, args=(url, username, password, jobs, results))
+		worker.daemon = True
+		worker.start()
+		workers.append(worker)
+
+	#write rows in the order returned by listSystems to keep reports reproducible
+	nextIndex = 0
+	savedCalls = 0
+	while True:
+		while nextIndex in pending:
+			writer.write_system(systems[nextIndex], pending.pop(nextIndex))
+			nextIndex = nextIndex + 1
+		if nextIndex >= len(systems):
+			break
+		(index, rows, saved) = results.get()
+		pending[index] = rows
+		savedCalls = savedCalls + saved
+
+	#wait for workers to log out
+	for worker in workers:
+		worker.join()
+	return savedCalls
+
+
+
+def process_worker(url, username, password, jobs, results):
+	#worker thread, xmlrpclib connections can't be shared between threads
+	client = SatelliteSession(url, username, password, verbose=options.debug)
+	batcher = ConcurrentClient(client, options.concurrency, options.batchSize)
+	key = None
+	while True:
+		try:
+			chunk = jobs.get_nowait()
+		except Queue.Empty:
+			break
+
+		prefetched = None
+		for (index, system) in chunk:
+			collector = RowCollector()
+			try:
+				if key is None:
+					key = client.login()
+				if prefetched is None:
+					prefetched = prefetch_systems(batcher, key, [item[1] for item in chunk])
+				saved = process_system(batcher, key, collector, system, prefetched.get(system["id"]))
+				results.put((index, collector.rows, saved))
+			except Exception, e:
+				#drop incomplete results, but don't stall the remaining workers
+				LOGGER.error("Unable to scan host {0[name]} (SID {0[id]}): {1}".format(system, e))
+				results.put((index, None, 0))
+
+	batcher.close()
+	client.logout()
+	client.close()
+
+
+
+class KeywordCache(object):
+	#caches errata keywords by advisory name, optionally persisted in a file
+	def __init__(self, filename="", ttl=86400):
+		self.filename = filename
+		self.ttl = ttl
+		self.saved = 0
+		self.lock = threading.Lock()
+		#advisory name: (timestamp, keywords)
+		self.entries = {}
+		if filename and os.path.exists(filename):
+			self.load()
+
+	def load(self):
+		try:
+			with open(self.filename, "r") as cacheFile:
+				entries = json.load(cacheFile)
+		except (IOError, ValueError), e:
+			LOGGER.warning("Unable to read errata keyword cache ({0}): {1}".format(self.filename, e))
+			return
+		#drop expired entries
+		now = time.time()
+		for name, entry in entries.items():
+			if now - entry[0] < self.ttl:
+				self.entries[name] = (entry[0], entry[1])
+		LOGGER.debug("Loaded {0} errata keywords from cache ({1} expired)".format(len(self.entries), len(entries)-len(self.entries)))
+
+	def save(self):
+		if not self.filename:
+			return
+		try:
+			#replace file at once to avoid corrupted caches
+			with open(self.filename + ".tmp", "w") as cacheFile:
+				json.dump(self.entries, cacheFile)
+			os.rename(self.filename + ".tmp", self.filename)
+		except (IOError, OSError), e:
+			LOGGER.warning("Unable to write errata keyword cache ({0}): {1}".format(self.filename, e))
+
+	def get_many(self, batcher, key, names):
+		#get keywords for multiple errata, only unknown errata are looked up
+		keywords = {}
+		missing = []
+		with self.lock:
+			for name in names:
+				if name in self.entries:
+					keywords[name] = self.entries[name][1]
+					self.saved = self.saved + 1
+				elif name not in missing:
+					missing.append(name)
+		if missing:
+			results = batcher.call_many("errata.listKeywords", [(key, name) for name in missing])
+			with self.lock:
+				for name, result in zip(missing, results):
+					self.entries[name] = (time.time(), result)
+					keywords[name] = result
+		return keywords
+
+
+
+class SystemInfo(object):
+	#fetches system details, network, custom information and updates once per system
+	CALLS = ["getDetails", "getNetwork", "getCustomValues", "getRelevantErrata", "listLatestUpgradablePackages"]
+
+	def __init__(self, batcher, key, system, prefetched=None):
+		self.batcher = batcher
+		self.client = batcher.client
+		self.key = key
+		self.system = system
+		self.saved = 0
+		self._cache = dict(prefetched or {})
+		#first access of prefetched information doesn't count as saved call
+		self._prefetched = set(self._cache)
+
+	def _get(self, call):
+		if call in self._prefetched:
+			self._prefetched.remove(call)
+		elif call in self._cache:
+			#this would have been another XMLRPC call
+			self.saved = self.saved + 1
+		else:
+			self._cache[call] = getattr(self.client.system, call)(self.key, self.system["id"])
+		return self._cache[call]
+
+	def details(self):
+		return self._get("getDetails")
+
+	def network(self):
+		return self._get("getNetwork")
+
+	def custom_values(self):
+		return self._get("getCustomValues")
+
+	def relevant_errata(self):
+		return self._get("getRelevantErrata")
+
+	def upgradable_packages(self):
+		return self._get("listLatestUpgradablePackages")
+
+
+
+def prefetch_systems(batcher, key, systems):
+	#get system information for multiple systems using system.multicall or parallel calls
+	prefetched = {}
+	if (not batcher.supported and batcher.concurrency < 2) or len(systems) < 2:
+		return prefetched
+	for system in systems:
+		prefetched[system["id"]] = {}
+	for call in SystemInfo.CALLS:
+		if call == "listLatestUpgradablePackages" and options.excludePatches:
+			continue
+		argsList = [(key, system["id"]) for system in systems]
+		for system, result in zip(systems, batcher.call_many("system." + call, argsList)):
+			prefetched[system["id"]][call] = result
+	return prefetched
+
+
+
+def process_system(batcher, key, writer, system, prefetched=None):
+	LOGGER.debug("Found host {0[name]} (SID {0[id]})".format(system))
+	info = SystemInfo(batcher, key, system, prefetched)
+	process_errata(info, writer)
+
+	if options.excludePatches == False:
+		process_patches(info, writer)
+
+	LOGGER.debug("Saved {0} XMLRPC calls for host {1[name]} (SID {1[id]})".format(info.saved, system))
+	return info.saved
+
+
+
+def get_system_value(info, column):
+	#get host-specific column value
+	if column == "hostname":
+		return info.system["name"]
+	elif column == "ip":
+		return info.network()["ip"]
+	elif column == "system_virt":
+		temp = info.details()
+		if temp and "virtualization" in temp:
+			return 1
+		else:
+			return 0
+
+	temp = info.custom_values()
+	if column == "system_owner":
+		if temp and "SYSTEM_OWNER" in temp:
+			return ' '.join(temp["SYSTEM_OWNER"].split())
+		else:
+			return "unknown"
+	elif column in ["system_prod", "system_cluster", "system_virt_snapshot",
+		"system_monitoring", "system_backup", "system_antivir"]:
+		#flags
+		if (temp and column.upper() in temp
+			and temp[column.upper()] == "1"):
+			return 1
+		else:
+			return 0
+	elif column in ["system_monitoring_notes", "system_backup_notes",
+		"system_antivir_notes"]:
+		#notes
+		if temp and column.upper() in temp:
+			return temp[column.upper()]
+		else:
+			return ""
+	elif column == "system_virt_vmname":
+		temp_vmname = ""
+		if (temp and "SYSTEM_VIRT_VMNAME" in temp
+			and temp["SYSTEM_VIRT_VMNAME"] != ""):
+			temp_vmname = temp["SYSTEM_VIRT_VMNAME"]
+			#also add custom host and password if given
+			if ("SYSTEM_VIRT_HOST" in temp
+			and temp["SYSTEM_VIRT_HOST"] != "" and
+			"SYSTEM_VIRT_HOST_AUTH" in temp and
+			temp["SYSTEM_VIRT_HOST_AUTH"] != ""):
+				temp_vmname = temp_vmname + "@" + temp["SYSTEM_VIRT_HOST"] + ":" + temp["SYSTEM_VIRT_HOST_AUTH"]
+		return temp_vmname
+	elif column == "system_monitoring_name":
+		temp_monname = ""
+		if (temp and "SYSTEM_MONITORING_NAME" in temp
+			and temp["SYSTEM_MONITORING_NAME"] != ""):
+			temp_monname = temp["SYSTEM_MONITORING_NAME"]
+			#also add custom host and password if given
+			if ("SYSTEM_MONITORING_HOST" in temp
+			and temp["SYSTEM_MONITORING_HOST"] != "" and
+			"SYSTEM_MONITORING_HOST_AUTH" in temp and
+			temp["SYSTEM_MONITORING_HOST_AUTH"] != ""):
+				temp_monname = temp_monname + "@" + temp["SYSTEM_MONITORING_HOST"] + ":" + temp["SYSTEM_MONITORING_HOST_AUTH"]
+		return temp_monname
+	return ""
+
+
+
+def write_row(writer, valueSet):
+	#replace unicodes
+	for i,field in enumerate(valueSet):
+		if type(field) is unicode:
+			LOGGER.debug("Converted to ascii: {ascii}".format(
+				ascii=unidecode(field)
+			))
+			valueSet[i] = str(unidecode(field))
+		#remove crap
+		valueSet[i] = escape_string(str(valueSet[i]))
+
+	writer.writerow(valueSet)
+
+
+
+def process_errata(info, writer):
+	client = info.client
+	key = info.key
+	system = info.system
 
-def process_errata(client, key, writer, system):
-	columnErrataMapping = {
-		"hostname": "name",
-		"errata_name": "advisory_name",
-		"errata_type": "advisory_type",
-		"errata_desc": "advisory_synopsis",
-		"errata_date": "update_date"
-	}
-	
 	#break if system locked
-	details = client.system.getDetails(key, system["id"])
+	details = info.details()
 	if details["lock_status"] != False and options.includeLocked == False:
 		LOGGER.info("Skipping errata for locked host "
 			"{system[name]} (SID {system[id]})...".format(
@@ -171,7 +707,7 @@ def process_errata(client, key, writer, system):
 	
 	#TODO: errata_* not working! Implemented a workaround (looking for a "nicer" way to do this)
 	
-	errata = client.system.getRelevantErrata(key, system["id"])
+	errata = info.relevant_errata()
 	if not errata:
 		LOGGER.debug("Host {0[name]} (SID {0[id]}) has no relevant errata.".format(system))
 		return
@@ -182,6 +718,14 @@ def process_errata(client, key, writer, system):
 			)
 		)
 
+	#get keywords required for reboot detection
+	keywords = {}
+	names = [erratum["advisory_name"] for erratum in errata if "kernel" not in erratum["advisory_synopsis"]]
+	try:
+		keywords = KEYWORD_CACHE.get_many(info.batcher, key, names)
+	except xmlrpclib.Fault, e:
+		LOGGER.debug("Unable to get keywords for all errata at once: {0}".format(e))
+
 	for i, erratum in enumerate(errata, start=1):
 		LOGGER.debug("Having a look at relevant errata #{errata} "
 			"for host {system[name]} (SID {system[id]})...".format(
@@ -192,21 +736,8 @@ def process_errata(client, key, writer, system):
 		
 		valueSet = []
 		for column in DEFAULT_FIELDS:
-			try:
-				valueSet.append(system[columnErrataMapping[column]])
-				LOGGER.debug("Translated column '" + column + "' in '" + columnErrataMapping[column] + "'") 
-				continue
-			except KeyError:
-				#Key not found - probably needs more logic.
-				LOGGER.debug("Could not find column '" + column + "' in columnErrataMapping")
-				pass
-			
-			if column == "ip":
-				temp = client.system.getNetwork(key, system["id"])
-				valueSet.append(temp["ip"])
-			
 			###WORKAROUND###
-			elif column == "errata_name":
+			if column == "errata_name":
 				try:
 					valueSet.append(errata[i]["advisory_name"])
 				except:
@@ -233,134 +764,31 @@ def process_errata(client, key, writer, system):
 					if "kernel" in errata[i]["advisory_synopsis"]:
 						valueSet.append("1")
 					else:
-						temp = client.errata.listKeywords(key, errata[i]["advisory_name"])
+						if errata[i]["advisory_name"] in keywords:
+							temp = keywords[errata[i]["advisory_name"]]
+						else:
+							temp = KEYWORD_CACHE.get_many(info.batcher, key, [errata[i]["advisory_name"]])[errata[i]["advisory_name"]]
 						if "reboot_suggested" in temp:
 							valueSet.append("1")
 						else:
 							valueSet.append("0")
 				except:
 					valueSet.append("0")
-			elif column == "system_owner":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_OWNER" in temp:
-					valueSet.append(' '.join(temp["SYSTEM_OWNER"].split()))
-				else:
-					valueSet.append("unknown")
-			elif column == "system_prod":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_PROD" in temp
-					and temp["SYSTEM_PROD"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_cluster":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_CLUSTER" in temp
-					and temp["SYSTEM_CLUSTER"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_virt":
-				temp = client.system.getDetails(key, system["id"])
-				if temp and "virtualization" in temp:
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_virt_snapshot":
-                        	temp = client.system.getCustomValues(key, system["id"])
-                                if (temp and "SYSTEM_VIRT_SNAPSHOT" in temp
-                                        and temp["SYSTEM_VIRT_SNAPSHOT"] == "1"):
-                                        valueSet.append(1)
-                                else:
-                                        valueSet.append(0)
-			elif column == "system_virt_vmname":
-                        	temp = client.system.getCustomValues(key, system["id"])
-				temp_vmname=""
-                                if (temp and "SYSTEM_VIRT_VMNAME" in temp
-                                        and temp["SYSTEM_VIRT_VMNAME"] != ""):
-					temp_vmname=temp["SYSTEM_VIRT_VMNAME"]
-					#also add custom host and password if given
-					if (temp and "SYSTEM_VIRT_HOST" in temp
-					and temp["SYSTEM_VIRT_HOST"] != "" and
-					"SYSTEM_VIRT_HOST_AUTH" in temp and
-					temp["SYSTEM_VIRT_HOST_AUTH"] != ""):
-						temp_vmname = temp_vmname + "@" + temp["SYSTEM_VIRT_HOST"] + ":" + temp["SYSTEM_VIRT_HOST_AUTH"]
-                                        valueSet.append(temp_vmname)
-				else: valueSet.append("")
-			elif column == "system_monitoring":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_MONITORING" in temp and
-					temp["SYSTEM_MONITORING"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_monitoring_name":
-				temp = client.system.getCustomValues(key, system["id"])
-				temp_monname = ""
-				if (temp and "SYSTEM_MONITORING_NAME" in temp
-					and temp["SYSTEM_MONITORING_NAME"] != ""):
-					temp_monname=temp["SYSTEM_MONITORING_NAME"]
-					#also add custom host and password if given
-					if (temp and "SYSTEM_MONITORING_HOST" in temp
-					and temp["SYSTEM_MONITORING_HOST"] != "" and
-					"SYSTEM_MONITORING_HOST_AUTH" in temp and
-					temp["SYSTEM_MONITORING_HOST_AUTH"] != ""):
-						temp_monname = temp_monname + "@" + temp["SYSTEM_MONITORING_HOST"] + ":" + temp["SYSTEM_MONITORING_HOST_AUTH"]
-					valueSet.append(temp_monname)
-				else:
-					valueSet.append("")
-			elif column == "system_monitoring_notes":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_MONITORING_NOTES" in temp:
-					valueSet.append(temp["SYSTEM_MONITORING_NOTES"])
-				else:
-					valueSet.append("")
-			elif column == "system_backup":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_BACKUP" in temp
-					and temp["SYSTEM_BACKUP"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_backup_notes":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_BACKUP_NOTES" in temp:
-					valueSet.append(temp["SYSTEM_BACKUP_NOTES"])
-				else:
-					valueSet.append("")
-			elif column == "system_antivir":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_ANTIVIR" in temp
-					and temp["SYSTEM_ANTIVIR"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_antivir_notes":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_ANTIVIR_NOTES" in temp:
-					valueSet.append(temp["SYSTEM_ANTIVIR_NOTES"])
-				else:
-					valueSet.append("")
+			else:
+				valueSet.append(get_system_value(info, column))
 
-		#replace unicodes
-		for i,field in enumerate(valueSet):
-			if type(field) is unicode:
-				LOGGER.debug("Converted to ascii: {ascii}".format(
-					ascii=unidecode(field)
-				))
-				valueSet[i] = str(unidecode(field))
-			#remove crap
-			valueSet[i] = escape_string(str(valueSet[i]))
-		
-		writer.writerow(valueSet)
+		write_row(writer, valueSet)
 
 
 
-def process_patches(client, key, writer, system):
-	updates = client.system.listLatestUpgradablePackages(key, system["id"])
+def process_patches(info, writer):
+	client = info.client
+	key = info.key
+	system = info.system
+	updates = info.upgradable_packages()
 
 	#break if system locked
-	details = client.system.getDetails(key, system["id"])
+	details = info.details()
 	if details["lock_status"] != False and options.includeLocked == False:
 		LOGGER.info("Skipping patches for locked host "
 			"{system[name]} (SID {system[id]})...".format(
@@ -379,6 +807,9 @@ def process_patches(client, key, writer, system):
 			)
 		)
 
+	#get errata providing the packages
+	providingErrata = info.batcher.call_many("packages.listProvidingErrata", [(key, update["to_package_id"]) for update in updates])
+
 	for i, update in enumerate(updates, start=1):
 		LOGGER.debug("Having a look at relevant package update "
 			"#{update} for host {system[name]} "
@@ -388,7 +819,7 @@ def process_patches(client, key, writer, system):
 			)
 		)
 		
-		if client.packages.listProvidingErrata(key, update["to_package_id"]):
+		if providingErrata[i-1]:
 			#We only add update information if it is not not
 			#already displayed as part of an erratum
 			LOGGER.debug("Dropping update {0[name]} "
@@ -399,12 +830,7 @@ def process_patches(client, key, writer, system):
 
 		valueSet = []
 		for column in DEFAULT_FIELDS:
-			if column == "hostname":
-				valueSet.append(system["name"])
-			elif column == "ip":
-				temp = client.system.getNetwork(key, system["id"])
-				valueSet.append(temp["ip"])
-			elif column == "errata_name":
+			if column == "errata_name":
 				valueSet.append(update["name"])
 			elif column == "errata_type":
 				valueSet.append("Regular update")
@@ -417,119 +843,10 @@ def process_patches(client, key, writer, system):
 					valueSet.append("1")
 				else:
 					valueSet.append("0")
-			elif column == "system_owner":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_OWNER" in temp:
-					valueSet.append(' '.join(temp["SYSTEM_OWNER"].split()))
-				else:
-					valueSet.append("unknown")
-			elif column == "system_prod":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_PROD" in temp
-					and temp["SYSTEM_PROD"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_cluster":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_CLUSTER" in temp
-					and temp["SYSTEM_CLUSTER"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_virt":
-				temp = client.system.getDetails(key, system["id"])
-				if temp and "virtualization" in temp:
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-                        elif column == "system_virt_snapshot":
-                                temp = client.system.getCustomValues(key, system["id"])
-                                if (temp and "SYSTEM_VIRT_SNAPSHOT" in temp
-                                        and temp["SYSTEM_VIRT_SNAPSHOT"] == "1"):
-                                        valueSet.append(1)
-                                else:
-                                        valueSet.append(0)
-			elif column == "system_virt_vmname":
-                        	temp = client.system.getCustomValues(key, system["id"])
-				temp_vmname=""
-                                if (temp and "SYSTEM_VIRT_VMNAME" in temp
-                                        and temp["SYSTEM_VIRT_VMNAME"] != ""):
-					temp_vmname=temp["SYSTEM_VIRT_VMNAME"]
-					#also add custom host and password if given
-					if (temp and "SYSTEM_VIRT_HOST" in temp
-					and temp["SYSTEM_VIRT_HOST"] != "" and
-					"SYSTEM_VIRT_HOST_AUTH" in temp and
-					temp["SYSTEM_VIRT_HOST_AUTH"] != ""):
-						temp_vmname = temp_vmname + "@" + temp["SYSTEM_VIRT_HOST"] + ":" + temp["SYSTEM_VIRT_HOST_AUTH"]
-                                        valueSet.append(temp_vmname)
-				else: valueSet.append("")
-			elif column == "system_monitoring":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_MONITORING" in temp and
-					temp["SYSTEM_MONITORING"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_monitoring_name":
-				temp = client.system.getCustomValues(key, system["id"])
-				temp_monname = ""
-				if (temp and "SYSTEM_MONITORING_NAME" in temp
-					and temp["SYSTEM_MONITORING_NAME"] != ""):
-					temp_monname=temp["SYSTEM_MONITORING_NAME"]
-					#also add custom host and password if given
-					if (temp and "SYSTEM_MONITORING_HOST" in temp
-					and temp["SYSTEM_MONITORING_HOST"] != "" and
-					"SYSTEM_MONITORING_HOST_AUTH" in temp and
-					temp["SYSTEM_MONITORING_HOST_AUTH"] != ""):
-						temp_monname = temp_monname + "@" + temp["SYSTEM_MONITORING_HOST"] + ":" + temp["SYSTEM_MONITORING_HOST_AUTH"]
-					valueSet.append(temp_monname)
-				else:
-					valueSet.append("")
-			elif column == "system_monitoring_notes":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_MONITORING_NOTES" in temp:
-					valueSet.append(temp["SYSTEM_MONITORING_NOTES"])
-				else:
-					valueSet.append("")
-			elif column == "system_backup":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_BACKUP" in temp
-					and temp["SYSTEM_BACKUP"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_backup_notes":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_BACKUP_NOTES" in temp:
-					valueSet.append(temp["SYSTEM_BACKUP_NOTES"])
-				else:
-					valueSet.append("")
-			elif column == "system_antivir":
-				temp = client.system.getCustomValues(key, system["id"])
-				if (temp and "SYSTEM_ANTIVIR" in temp
-					and temp["SYSTEM_ANTIVIR"] == "1"):
-					valueSet.append(1)
-				else:
-					valueSet.append(0)
-			elif column == "system_antivir_notes":
-				temp = client.system.getCustomValues(key, system["id"])
-				if temp and "SYSTEM_ANTIVIR_NOTES" in temp:
-					valueSet.append(temp["SYSTEM_ANTIVIR_NOTES"])
-				else:
-					valueSet.append("")
+			else:
+				valueSet.append(get_system_value(info, column))
 
-		#replace unicodes
-		for i,field in enumerate(valueSet):
-			if type(field) is unicode:
-				LOGGER.debug("Converted to ascii: {ascii}".format(
-					ascii=unidecode(field)
-				))
-				valueSet[i] = str(unidecode(field))
-			#remove crap
-			valueSet[i] = escape_string(str(valueSet[i]))
-		
-		writer.writerow(valueSet)
+		write_row(writer, valueSet)
 
 
 
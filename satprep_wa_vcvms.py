@@ -3,9 +3,8 @@
 
 import logging
 import sys
-import xmlrpclib
 from optparse import OptionParser, OptionGroup
-from satprep_shared import check_if_api_is_supported, get_credentials
+from satprep_shared import check_if_api_is_supported, get_credentials, ConcurrentClient, SatelliteSession
 from pysphere import VIServer
 
 
@@ -40,9 +39,11 @@ def main(options):
 	
 	#connect to Satellite
 	satellite_url = "http://{0}/rpc/api".format(options.satServer)
-	mySat = xmlrpclib.Server(satellite_url, verbose=options.debug)
+	mySat = SatelliteSession(satellite_url, satUsername, satPassword, verbose=options.debug)
 	key = mySat.auth.login(satUsername, satPassword)
 	check_if_api_is_supported(mySat)
+	#custom information of all systems is read in parallel
+	batcher = ConcurrentClient(mySat, options.concurrency)
 	
 	#print information about host
 	LOGGER.info("Connected to " + options.vcServer + " (" + myVC.get_server_type() + "), version " + myVC.get_api_version() + ".")
@@ -75,10 +76,9 @@ def main(options):
 	satlist = mySat.system.listSystems(key)
 	target_vms=[]
 	LOGGER.info("Digging through list of systems managed by Satellite...")
-	for system in satlist:
+	satKeys = batcher.call_many("system.getCustomValues", [(key, system["id"]) for system in satlist])
+	for system, thisKeys in zip(satlist, satKeys):
 		LOGGER.debug("Found system '" + system["name"] + "'")
-		#get custom keys
-		thisKeys = mySat.system.getCustomValues(key, system["id"])
 		#add virt_vmname if given
 		if "SYSTEM_VIRT_VMNAME" in thisKeys and thisKeys["SYSTEM_VIRT_VMNAME"] != "":
 			target_vms.append(thisKeys["SYSTEM_VIRT_VMNAME"])
@@ -111,10 +111,9 @@ def main(options):
 	#get list of all Linux VMs managed by Satellite
 	satlist = mySat.system.listSystems(key)
 	LOGGER.info("Updating relevant system custom info keys...")
-	for system in satlist:
+	satKeys = batcher.call_many("system.getCustomValues", [(key, system["id"]) for system in satlist])
+	for system, thisKeys in zip(satlist, satKeys):
 		LOGGER.debug("Found system '" + system["name"] + "'")
-		#get custom keys
-		thisKeys = mySat.system.getCustomValues(key, system["id"])
 		#update key if exists
 		if "SYSTEM_VIRT_HOST" in thisKeys and thisKeys["SYSTEM_VIRT_HOST"] != "":
 			#get ESXi host running VM
@@ -140,6 +139,8 @@ def main(options):
 					if mySat.system.setCustomValues(key, system["id"], {"SYSTEM_VIRT_HOST": this_value}):
 						LOGGER.info("Updated virtual host entry for system '" + system["name"] + "' (ID " + str(system["id"]) + ").")
 				else: LOGGER.error("No valid virt host entry for system '" + system["name"] + "' (ID " + str(system["id"]) + ") found!")
+	batcher.close()
+	mySat.close()
 
 
 
@@ -225,6 +226,8 @@ def parse_options(args=None):
 	satOpts.add_option("-a", "--satellite-authfile", dest="satAuthfile", metavar="FILE", default="", help="defines an auth file to use for Satellite")
 	#-s / --satellite-server
 	satOpts.add_option("-s", "--satellite-server", dest="satServer", metavar="SERVER", default="localhost", help="defines the Satellite server to use (default: localhost)")
+	#-C / --concurrency
+	satOpts.add_option("-C", "--concurrency", action="store", type="int", default=1, dest="concurrency", metavar="NUMBER", help="reads custom information of up to NUMBER systems at once using keep-alive connections (default: 1)")
 	
 	#VCENTER OPTIONS
 	#-A / --vcenter-authfile